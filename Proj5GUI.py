@@ -1,6 +1,7 @@
 #!/usr/local/bin/python3.7
 
 import math
+import numpy as np
 import random
 import signal
 import sys
@@ -217,6 +218,10 @@ class Proj5GUI( QMainWindow ):
 		xr = self.data_range['x']
 		yr = self.data_range['y']
 		npoints = int(self.size.text())
+		if self.diffDropDown.currentText() != 'Hard (Deterministic)':
+			# Draw every point at once, as an (n,2) array Scenario takes directly
+			unit = np.random.default_rng( seed ).uniform( 0.0, 1.0, (npoints, 2) )
+			return np.column_stack( (xr[0] + (xr[1]-xr[0])*unit[:,0], yr[0] + (yr[1]-yr[0])*unit[:,1]) )
 		while len(ptlist) < npoints:
 			x = random.uniform(0.0,1.0)
 			y = random.uniform(0.0,1.0)
@@ -370,7 +375,13 @@ class Proj5GUI( QMainWindow ):
 		('Default                            ','defaultRandomTour'), \
 		('Greedy','greedy'), \
 		('Branch and Bound','branchAndBound'), \
-		('Fancy','fancy') \
+		('Fancy','fancy'), \
+		('Multi-start Construction','constructionHeuristics'), \
+		('Lin-Kernighan','linKernighan'), \
+		('Simulated Annealing','simulatedAnnealing'), \
+		('Genetic','genetic'), \
+		('Ant Colony','antColony'), \
+		('Held-Karp','heldKarp') \
 	]															# whitespace hack to get longest to display correctly
 
 	def initUI( self ):
@@ -1,46 +1,117 @@
 #!/usr/bin/python3
 
 
+import json
 import math
+import multiprocessing
+from multiprocessing import shared_memory
 import numpy as np
+import os
 import random
+import re
 import time
 
 
 
+# Costs are stored as compact integer arrays.  A missing edge is marked with the
+# largest value of the cost dtype rather than np.inf, so cost matrices never mix
+# ints with floats.  Sums of costs should be taken in int64.
+COST_DTYPE = np.int32
+NO_EDGE = np.iinfo(COST_DTYPE).max
+
+def isNoEdge( cost ):
+	return cost >= NO_EDGE
+
+def hasEdge( cost ):
+	return cost < NO_EDGE
+
+
+
+''' <summary>
+	A tour, stored as an int array of city indices into the scenario's cities.  Its cost
+	is one fancy-indexed sum over the scenario's costs, worked out when first asked
+	for, and route (the City objects the GUI draws) is only built when it is used.
+	snapshot() is cheap: the copy shares the tour array until one of them changes it.
+	</summary> '''
 class TSPSolution:
-	def __init__( self, listOfCities):
-		self.route = listOfCities
-		self.cost = self._costOfRoute()
+	__slots__ = ( '_scenario', '_tour', '_cost', '_route' )
+
+	def __init__( self, listOfCities ):
+		self._scenario = listOfCities[0]._scenario
+		self._tour = np.array( [city._index for city in listOfCities], dtype=np.int64 )
+		self._cost = None
+		self._route = listOfCities
 		#print( [c._index for c in listOfCities] )
 
+	@staticmethod
+	def fromTour( scenario, tour ):
+		''' The solution visiting the scenario's cities in the order of the index array tour (which is copied). '''
+		solution = TSPSolution.__new__( TSPSolution )
+		solution._scenario = scenario
+		solution._tour = np.array( tour, dtype=np.int64 )
+		solution._cost = None
+		solution._route = None
+		return solution
+
+	@property
+	def tour( self ):
+		tour = self._tour.view()
+		tour.flags.writeable = False
+		return tour
+
+	@property
+	def route( self ):
+		if self._route is None:
+			cities = self._scenario.getCities()
+			self._route = [cities[i] for i in self._tour.tolist()]
+		return self._route
+
+	@property
+	def cost( self ):
+		if self._cost is None:
+			self._cost = self._costOfRoute()
+		return self._cost
+
+	def __len__( self ):
+		return len(self._tour)
+
+	def legCosts( self ):
+		''' The cost of every leg, leg k leaving the kth city of the tour (NO_EDGE if the edge is missing). '''
+		return self._scenario.costs()[self._tour, np.roll(self._tour,-1)]
+
 	def _costOfRoute( self ):
-		cost = 0
-		#print('cost = ',cost)
-		last = self.route[0]
-		for city in self.route[1:]:
-			#print('cost increasing by {} for leg {} to {}'.format(last.costTo(city),last._name,city._name))
-			cost += last.costTo(city)
-			last = city
-		#print('cost increasing by {} for leg {} to {}'.format(self.route[-1].costTo(self.route[0]),self.route[-1]._name,self.route[0]._name))
-		cost += self.route[-1].costTo( self.route[0] )
-		#print('cost = ',cost)
-		return cost
+		legs = self.legCosts()
+		if isNoEdge(legs).any():
+			return np.inf
+		return int( legs.sum(dtype=np.int64) )
+
+	def snapshot( self ):
+		''' A copy of this solution that shares its tour array until either of them changes it. '''
+		self._tour.flags.writeable = False
+		copy = TSPSolution.__new__( TSPSolution )
+		copy._scenario, copy._tour, copy._cost, copy._route = self._scenario, self._tour, self._cost, self._route
+		return copy
+
+	def reverse( self, i, j ):
+		''' Reverses the cities at positions i..j of the tour (a 2-opt move). '''
+		tour = self._ownTour()
+		tour[i:j+1] = tour[i:j+1][::-1].copy()
+
+	def _ownTour( self ):
+		# Copy on write: a tour shared with a snapshot is read-only, so copy it before changing it
+		if not self._tour.flags.writeable:
+			self._tour = self._tour.copy()
+		self._cost = None
+		self._route = None
+		return self._tour
 
 	def enumerateEdges( self ):
-		elist = []
-		c1 = self.route[0]
-		for c2 in self.route[1:]:
-			dist = c1.costTo( c2 )
-			if dist == np.inf:
-				return None
-			elist.append( (c1, c2, int(math.ceil(dist))) )
-			c1 = c2
-		dist = self.route[-1].costTo( self.route[0] )
-		if dist == np.inf:
+		legs = self.legCosts()
+		if isNoEdge(legs).any():
 			return None
-		elist.append( (self.route[-1], self.route[0], int(math.ceil(dist))) )
-		return elist
+		cities = self._scenario.getCities()
+		return [ (cities[src], cities[dst], cost) for src, dst, cost in
+				 zip( self._tour.tolist(), np.roll(self._tour,-1).tolist(), legs.tolist() ) ]
 
 
 def nameForInt( num ):
@@ -52,30 +123,183 @@ def nameForInt( num ):
 		return nameForInt((num-1) // 26 ) + nameForInt((num-1)%26+1)
 
 
+def condensedIndex( n, i, j ):
+	''' Position of the pair (i,j), i != j, in an upper-triangular condensed matrix of n cities. '''
+	if i > j:
+		i, j = j, i
+	return n*i - i*(i+1)//2 + (j-i-1)
+
 
 
 
 
 
 
+
+''' <summary>
+	Stands in for the cost matrix of a sparse scenario: indexing it like an n x n array
+	(C[i], C[a,b], C[rows,cols] with broadcasting, or a slice for either index)
+	computes just the costs asked for with Scenario.pairCosts.
+	</summary> '''
+class LazyCostMatrix:
+	dtype = COST_DTYPE
+
+	def __init__( self, scenario ):
+		self._scenario = scenario
+		ncities = len(scenario.getCities())
+		self.shape = (ncities, ncities)
+
+	def __len__( self ):
+		return self.shape[0]
+
+	def __getitem__( self, index ):
+		src, dst = index if isinstance( index, tuple ) else (index, slice(None))
+		if isinstance( dst, slice ):
+			src = np.arange( self.shape[0] )[src] if isinstance( src, slice ) else np.asarray( src )
+			return self._scenario.pairCosts( src[...,np.newaxis], np.arange( self.shape[1] )[dst] )
+		dst = np.asarray( dst )
+		if isinstance( src, slice ):
+			return self._scenario.pairCosts( np.arange( self.shape[0] )[src].reshape( (-1,) + (1,)*dst.ndim ), dst )
+		return self._scenario.pairCosts( np.asarray( src ), dst )
+
+
+''' <summary>
+	NumPy arrays published once in multiprocessing.shared_memory blocks, for process
+	pools that would otherwise each get their own pickled copy.  Pickling one sends
+	just the block names, shapes and dtypes, and unpickling attaches read-only views;
+	shared['name'] is the array either way.  Whoever publishes must close() it (which
+	also frees the blocks) once the workers are done, most simply in a with statement.
+
+	Pools started with fork never pickle their initargs: the workers inherit the
+	publisher's own object.  So pools get theirs from forPool, which under fork
+	publishes nothing and just hands on read-only views of the arrays (the pages are
+	shared copy-on-write anyway), and only publishes for spawn and forkserver.
+	</summary> '''
+class SharedArrays:
+	def __init__( self, handle, blocks, owner ):
+		self._handle = handle
+		self._blocks = blocks
+		self._owner = owner
+		self._arrays = {}
+		for (name, (block_name, shape, dtype)), block in zip( handle.items(), blocks ):
+			array = np.ndarray( shape, dtype=dtype, buffer=block.buf )
+			array.flags.writeable = owner
+			self._arrays[name] = array
+
+	@staticmethod
+	def publish( **arrays ):
+		handle, blocks = {}, []
+		try:
+			for name, array in arrays.items():
+				array = np.asarray( array )
+				block = shared_memory.SharedMemory( create=True, size=max( array.nbytes, 1 ) )
+				blocks.append( block )
+				np.ndarray( array.shape, dtype=array.dtype, buffer=block.buf )[...] = array
+				handle[name] = ( block.name, array.shape, array.dtype.str )
+		except:
+			for block in blocks:
+				block.close()
+				block.unlink()
+			raise
+		return SharedArrays( handle, blocks, owner=True )
+
+	@staticmethod
+	def forPool( **arrays ):
+		''' The arrays for the initargs of a process pool with the default start method. '''
+		if multiprocessing.get_start_method() != 'fork':
+			return SharedArrays.publish( **arrays )
+		shared = SharedArrays( {}, [], owner=False )
+		for name, array in arrays.items():
+			shared._arrays[name] = np.asarray( array ).view()
+			shared._arrays[name].flags.writeable = False
+		return shared
+
+	@staticmethod
+	def attach( handle ):
+		blocks = []
+		for block_name, shape, dtype in handle.values():
+			try:
+				# Only the publisher may free the blocks, not an attaching process's resource tracker
+				blocks.append( shared_memory.SharedMemory( name=block_name, track=False ) )
+			except TypeError:	# Before Python 3.13
+				blocks.append( shared_memory.SharedMemory( name=block_name ) )
+		return SharedArrays( handle, blocks, owner=False )
+
+	def __getitem__( self, name ):
+		return self._arrays[name]
+
+	def __contains__( self, name ):
+		return name in self._arrays
+
+	def __getstate__( self ):
+		if self._arrays and not self._handle:
+			raise TypeError( 'Arrays handed to a forked pool are not in shared memory and cannot be pickled' )
+		return self._handle
+
+	def __setstate__( self, handle ):
+		self.__init__( handle, SharedArrays.attach( handle )._blocks, owner=False )
+
+	def close( self ):
+		self._arrays = {}
+		for block in self._blocks:
+			block.close()
+			if self._owner:
+				block.unlink()
+		self._blocks = []
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, *exc_info ):
+		self.close()
+
+
 class Scenario:
 
 	HARD_MODE_FRACTION_TO_REMOVE = 0.20 # Remove 20% of the edges
 
-	def __init__( self, city_locations, difficulty, rand_seed ):
+	''' <summary>
+		With sparse=True no n x n array is ever kept: which edges exist is decided by
+		edgeExists (Hard scenarios remove a hashed, reproducible 20% of the edges instead
+		of marking them in a matrix), and costs() computes costs on demand, so neighbour
+		list heuristics (fancy, linKernighan, simulatedAnnealing) and random tours run on
+		scenarios far too big for a dense matrix.  costMatrix() raises instead, so the
+		solvers that need the whole matrix fail at once rather than build it.
+		</summary> '''
+	def __init__( self, city_locations, difficulty, rand_seed, sparse=False ):
 		self._difficulty = difficulty
+		self._sparse = sparse
+
+		# city_locations is a list of QPointFs or an (n,2) array of x, y
+		if isinstance( city_locations, np.ndarray ):
+			locations = city_locations.astype( float ).reshape( -1, 2 )
+		else:
+			locations = np.array( [(pt.x(), pt.y()) for pt in city_locations], dtype=float ).reshape( -1, 2 )
+		ncities = len(locations)
 
 		if difficulty == "Normal" or difficulty == "Hard":
-			self._cities = [City( pt.x(), pt.y(), \
-								  random.uniform(0.0,1.0) \
-								) for pt in city_locations]
+			# All at once, from a generator seeded by the (GUI-seeded) random module
+			elevations = np.random.default_rng( random.getrandbits(64) ).uniform( 0.0, 1.0, ncities )
 		elif difficulty == "Hard (Deterministic)":
+			# Keeps its own sequence, one random.uniform per city, so old scenarios come out the same
 			random.seed( rand_seed )
-			self._cities = [City( pt.x(), pt.y(), \
-								  random.uniform(0.0,1.0) \
-								) for pt in city_locations]
+			elevations = np.array( [random.uniform(0.0,1.0) for city in range(ncities)] )
 		else:
-			self._cities = [City( pt.x(), pt.y() ) for pt in city_locations]
+			elevations = np.zeros( ncities )
+		self._setCities( locations, elevations )
+
+		# Assume all edges exists except self-edges
+		self._edge_exists = ~np.eye( ncities, dtype=bool ) if not sparse else None
+		self._keep_next = None
+
+		#print( self._edge_exists )
+		if difficulty == "Hard":
+			self.thinEdges()
+		elif difficulty == "Hard (Deterministic)":
+			self.thinEdges(deterministic=True)
+
+	def _setCities( self, locations, elevations ):
+		self._cities = [City( x, y, elevation ) for (x, y), elevation in zip( locations.tolist(), elevations.tolist() )]
 
 
 		num = 0
@@ -85,20 +309,213 @@ class Scenario:
 			city.setIndexAndName( num, nameForInt( num+1 ) )
 			num += 1
 
-		# Assume all edges exists except self-edges
-		ncities = len(self._cities)
-		self._edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
+		# Coordinates and elevations as arrays so costs can be computed with broadcasting
+		self._x = locations[:,0].copy()
+		self._y = locations[:,1].copy()
+		self._elevation = elevations
+		self._cost_matrix = None
+		self._geometric = True	# Costs come from the map, not from an explicit matrix
+		self._grid = None
 
-		#print( self._edge_exists )
-		if difficulty == "Hard":
-			self.thinEdges()
-		elif difficulty == "Hard (Deterministic)":
-			self.thinEdges(deterministic=True)
+	''' <summary>
+		A scenario built straight from arrays instead of generated: the (n,2) city
+		locations, their elevations (zero if None) and either the edge_exists mask
+		(costs are then computed from the map as usual; all edges but self-edges if
+		None) or an explicit n x n cost_matrix, NO_EDGE for missing edges and on the
+		diagonal, used as is (a read-only memmap works too).
+		</summary> '''
+	@staticmethod
+	def fromArrays( locations, elevations=None, difficulty='Normal', edge_exists=None, cost_matrix=None, sparse=False ):
+		scenario = Scenario.__new__( Scenario )
+		locations = np.asarray( locations, dtype=float ).reshape( -1, 2 )
+		ncities = len(locations)
+		scenario._difficulty = difficulty
+		scenario._sparse = sparse
+		scenario._setCities( locations, np.zeros( ncities ) if elevations is None else np.asarray( elevations, dtype=float ) )
+		if cost_matrix is not None:
+			if np.shape( cost_matrix ) != (ncities, ncities):
+				raise ValueError( 'Cost matrix of shape {} for {} cities'.format(np.shape(cost_matrix), ncities) )
+			scenario._cost_matrix = cost_matrix
+			scenario._geometric = False
+			if edge_exists is None:
+				edge_exists = hasEdge( cost_matrix )
+		if edge_exists is None and not sparse:
+			edge_exists = ~np.eye( ncities, dtype=bool )
+		scenario._edge_exists = edge_exists
+		scenario._keep_next = None
+		return scenario
 
 	def getCities( self ):
 		return self._cities
 
 
+	''' <summary>
+		The full n x n matrix of City.costTo values, computed once for all city pairs
+		with NumPy broadcasting and cached on the scenario.  Entry [i,j] is the cost
+		of going from city i to city j as a COST_DTYPE int, or NO_EDGE when that edge
+		does not exist (including the self-edges on the diagonal).  A sparse scenario
+		never builds it (raises ValueError); index costs() instead.
+		</summary> '''
+	COST_BLOCK_SIZE = 1<<22	# Number of float temporaries computed at a time
+	def costMatrix( self ):
+		if self._sparse:
+			raise ValueError( 'A sparse scenario has no dense cost matrix; use costs() or the neighbour list solvers' )
+		if self._cost_matrix is None:
+			ncities = len(self._cities)
+			cost_matrix = np.empty( (ncities,ncities), dtype=COST_DTYPE )
+			rows = max( 1, self.COST_BLOCK_SIZE // max(ncities,1) )
+			for start in range( 0, ncities, rows ):
+				block = np.arange( start, min(start+rows, ncities) )
+				cost_matrix[block] = self.pairCosts( block[:,np.newaxis], np.arange(ncities)[np.newaxis,:] )
+			self._cost_matrix = cost_matrix
+		return self._cost_matrix
+
+	''' <summary>
+		City.costTo for arrays of source and destination city indices (broadcast against
+		each other), computed from the coordinates without the cost matrix.
+		</summary> '''
+	def pairCosts( self, src, dst ):
+		if not self._geometric:
+			return self._cost_matrix[src,dst]
+
+		# Euclidean Distance
+		cost = np.sqrt( (self._x[dst] - self._x[src])**2 + (self._y[dst] - self._y[src])**2 )
+
+		# For Medium and Hard modes, add in an asymmetric cost (in easy mode it is zero).
+		if not self._difficulty == 'Easy':
+			cost = np.maximum( cost + (self._elevation[dst] - self._elevation[src]), 0.0 )
+
+		return np.where( self.edgeExists( src, dst ), np.ceil( cost * City.MAP_SCALE ), NO_EDGE ).astype( COST_DTYPE )
+
+	''' <summary>
+		Uniform grid over the city locations, about CITIES_PER_CELL cities to a cell: the
+		cities sorted by cell (row-major) and where each cell's cities start in that order.
+		</summary> '''
+	CITIES_PER_CELL = 2
+	def _cityGrid( self ):
+		if self._grid is None:
+			ncities = len(self._cities)
+			side = max( 1, int( math.ceil( math.sqrt( ncities / self.CITIES_PER_CELL ) ) ) )
+			cells = []
+			for coords in (self._x, self._y):
+				span = coords.max() - coords.min() if ncities else 0.0
+				scaled = (coords - coords.min()) / span * side if span > 0 else np.zeros( ncities )
+				cells.append( np.minimum( scaled.astype(int), side-1 ) )
+			cell = cells[1]*side + cells[0]
+			order = np.argsort( cell, kind='stable' )
+			starts = np.searchsorted( cell[order], np.arange( side*side+1 ) )
+			self._grid = ( side, cells[0], cells[1], order, starts )
+		return self._grid
+
+	def spatialOrder( self ):
+		''' The cities ordered cell by cell through the city grid, so neighbours on the map are mostly close. '''
+		return self._cityGrid()[3]
+
+	def _gridCities( self, col, row, radius ):
+		''' The cities in the cells at most radius cells from (col, row) in either direction. '''
+		side, cell_cols, cell_rows, order, starts = self._cityGrid()
+		first, last = max( col-radius, 0 ), min( col+radius, side-1 )
+		return np.concatenate( [ order[starts[r*side+first]:starts[r*side+last+1]]
+								 for r in range( max(row-radius, 0), min(row+radius, side-1)+1 ) ] )
+
+	''' <summary>
+		Candidate lists for local search: for every city, its k cheapest outgoing edges
+		among the candidates cities nearest to it on the map (2k by default), found with
+		the city grid instead of a scan of every city.  The candidates are ranked by the
+		true, asymmetric cost, so missing edges rank last.
+		</summary>
+		<returns>an (n, k) int array of city indices, cheapest first</returns> '''
+	def neighbourLists( self, k, candidates=None ):
+		ncities = len(self._cities)
+		k = min( k, ncities-1 )
+		candidates = min( max( candidates or 2*k, k ), ncities-1 )
+		neighbours = np.empty( (ncities, k), dtype=np.int64 )
+		if not self._geometric:
+			# Explicit costs say nothing about the map, so rank whole rows of the matrix
+			rows = max( 1, self.COST_BLOCK_SIZE // max(ncities,1) )
+			for start in range( 0, ncities, rows ):
+				block = np.arange( start, min(start+rows, ncities) )
+				cost = self._cost_matrix[block].astype( np.int64 )
+				cost[np.arange( len(block) ), block] = NO_EDGE+1
+				nearest = np.argpartition( cost, max(k-1, 0), axis=1 )[:,:k]
+				order = np.take_along_axis( cost, nearest, axis=1 ).argsort( axis=1, kind='stable' )
+				neighbours[block] = np.take_along_axis( nearest, order, axis=1 )
+			return neighbours
+		side, cell_cols, cell_rows, order, starts = self._cityGrid()
+		for cell in np.flatnonzero( np.diff(starts) ):
+			members = order[starts[cell]:starts[cell+1]]
+			col, row = cell % side, cell // side
+			# Grow the window until it holds enough cities, then take one ring more so
+			# the nearest ones just outside the cell's own window are not missed
+			radius = 0
+			while len( self._gridCities( col, row, radius ) ) <= candidates and radius < side:
+				radius += 1
+			pool = self._gridCities( col, row, radius+1 )
+			distance = (self._x[pool] - self._x[members,np.newaxis])**2 + (self._y[pool] - self._y[members,np.newaxis])**2
+			nearest = pool[ np.argpartition( distance, candidates, axis=1 )[:,:candidates+1] ]
+			cost = self.pairCosts( members[:,np.newaxis], nearest ).astype( np.int64 )
+			cost[nearest == members[:,np.newaxis]] = NO_EDGE+1
+			neighbours[members] = np.take_along_axis( nearest, cost.argsort( axis=1, kind='stable' )[:,:k], axis=1 )
+		return neighbours
+
+	''' <summary>
+		The costs for the solvers to index: the dense costMatrix, or for a sparse scenario
+		a LazyCostMatrix that computes them as they are looked up.
+		</summary> '''
+	def costs( self ):
+		if self._sparse:
+			return LazyCostMatrix( self )
+		return self.costMatrix()
+
+	''' <summary>
+		Whether the edges from src to dst exist, for arrays of city indices (broadcast
+		against each other).  A sparse Hard scenario removes an edge when a hash of the
+		edge and the scenario's seed falls below the removal fraction, unless it is on
+		the route kept to guarantee a tour.
+		</summary> '''
+	def edgeExists( self, src, dst ):
+		if self._edge_exists is not None:
+			return self._edge_exists[src,dst]
+		exists = np.asarray( src != dst )
+		if self._keep_next is not None:
+			ncities = len(self._cities)
+			with np.errstate( over='ignore' ):
+				# splitmix64 of the edge's index, mixed with the seed
+				z = np.asarray( src, dtype=np.uint64 ) * np.uint64(ncities) + np.asarray( dst, dtype=np.uint64 ) + self._edge_seed
+				z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+				z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+				z = z ^ (z >> np.uint64(31))
+			kept = (z >> np.uint64(11)) >= np.uint64( self._removal_fraction * (1<<53) )
+			exists = exists & ( kept | (self._keep_next[src] == dst) )
+		return exists
+
+	def isSymmetric( self ):
+		# Only Easy costs ignore elevation, and Easy never removes edges
+		return self._difficulty == 'Easy'
+
+	''' <summary>
+		Half-size storage for symmetric (Easy) scenarios: the strict upper triangle of
+		the cost matrix packed row by row into a 1-D array, indexed with condensedIndex.
+		It is filled a block of rows at a time with pairCosts, so the dense matrix is
+		never built.  dtype may be COST_DTYPE or np.float32 (every cost this map produces
+		is exactly representable in a float32; missing edges become np.inf).
+		</summary> '''
+	def condensedCostMatrix( self, dtype=COST_DTYPE ):
+		if not self.isSymmetric():
+			raise ValueError( 'Condensed storage needs symmetric costs, not {} difficulty'.format(self._difficulty) )
+		ncities = len(self._cities)
+		condensed = np.empty( ncities*(ncities-1)//2, dtype=dtype )
+		rows = max( 1, self.COST_BLOCK_SIZE // max(ncities,1) )
+		cols = np.arange( ncities )
+		for start in range( 0, ncities, rows ):
+			block = np.arange( start, min(start+rows, ncities) )
+			costs = self.pairCosts( block[:,np.newaxis], cols )[ cols > block[:,np.newaxis] ]
+			offset = ncities*start - start*(start+1)//2
+			if np.dtype(dtype).kind == 'f':
+				costs = np.where( isNoEdge( costs ), np.inf, costs )
+			condensed[offset:offset+len(costs)] = costs
+		return condensed
+
 	def randperm( self, n ):				#isn't there a numpy function that does this and even gets called in Solver?
 		perm = np.arange(n)
 		for i in range(n):
@@ -113,6 +530,16 @@ class Scenario:
 		edge_count = ncities*(ncities-1) # can't have self-edge
 		num_to_remove = np.floor(self.HARD_MODE_FRACTION_TO_REMOVE*edge_count)
 
+		if self._sparse:
+			# Keep a route and seed the edge hash instead of removing edges from a matrix
+			route_keep = self.randperm( ncities ) if deterministic else np.random.permutation( ncities )
+			self._keep_next = np.empty( ncities, dtype=np.int64 )
+			self._keep_next[route_keep] = np.roll( route_keep, -1 )
+			self._edge_seed = np.uint64( random.getrandbits(64) if deterministic else np.random.randint( 1<<62 ) )
+			self._removal_fraction = num_to_remove / max( edge_count-ncities, 1 )
+			self._cost_matrix = None
+			return
+
 		#edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
 		can_delete	= self._edge_exists.copy()
 
@@ -120,23 +547,160 @@ class Scenario:
 		route_keep = np.random.permutation( ncities )
 		if deterministic:
 			route_keep = self.randperm( ncities )
-		for i in range(ncities):
-			can_delete[route_keep[i],route_keep[(i+1)%ncities]] = False
+		can_delete[route_keep, np.roll(route_keep,-1)] = False
 
 		# Now remove edges until 
-		while num_to_remove > 0:
-			if deterministic:
+		if deterministic:
+			# The deterministic scenarios keep their own one-pair-at-a-time sequence
+			while num_to_remove > 0:
 				src = random.randint(0,ncities-1)
 				dst = random.randint(0,ncities-1)
-			else:
-				src = np.random.randint(ncities)
-				dst = np.random.randint(ncities)
-			if self._edge_exists[src,dst] and can_delete[src,dst]:
-				self._edge_exists[src,dst] = False
-				num_to_remove -= 1
+				if self._edge_exists[src,dst] and can_delete[src,dst]:
+					self._edge_exists[src,dst] = False
+					num_to_remove -= 1
+		else:
+			# Draw as many edges as are left to remove at once and remove the ones that can
+			# still go (repeats included, so never too many), until enough are gone
+			exists = self._edge_exists.reshape( -1 )
+			deletable = can_delete.reshape( -1 )
+			target = np.count_nonzero( exists ) - int(num_to_remove)
+			num_to_remove = int(num_to_remove)
+			while num_to_remove > 0:
+				drawn = np.random.randint( ncities*ncities, size=num_to_remove )
+				exists[ drawn[ deletable[drawn] ] ] = False
+				num_to_remove = np.count_nonzero( exists ) - target
+		self._cost_matrix = None	# Any cached costs predate the removed edges
 
 		#print( self._edge_exists )
 
+	''' <summary>
+		Scenario files are a short JSON header followed by the scenario's arrays, each a
+		plain .npy record (coordinates, elevations, the edge mask and the cost matrix,
+		or the kept route for a sparse Hard scenario), so load can map them with
+		np.memmap instead of reading them and never rebuilds the O(n^2) costs.  Like
+		checkpoints, the file is written to a temporary name and then moved into place.
+		</summary> '''
+	SCENARIO_FILE_VERSION = 1
+	def save( self, path ):
+		arrays = { 'x': self._x, 'y': self._y, 'elevation': self._elevation }
+		if self._sparse:
+			if self._keep_next is not None:
+				arrays['keep_next'] = self._keep_next
+		else:
+			arrays['edge_exists'] = self._edge_exists
+			arrays['cost_matrix'] = self.costMatrix()
+		header = { 'version': self.SCENARIO_FILE_VERSION, 'difficulty': self._difficulty,
+				   'sparse': self._sparse, 'geometric': self._geometric, 'arrays': list(arrays) }
+		if self._sparse and self._keep_next is not None:
+			header.update( edge_seed=int(self._edge_seed), removal_fraction=float(self._removal_fraction) )
+		with open( path+'.tmp', 'wb' ) as scenario_file:
+			np.lib.format.write_array( scenario_file, np.frombuffer( json.dumps(header).encode(), dtype=np.uint8 ) )
+			for array in arrays.values():
+				np.lib.format.write_array( scenario_file, np.asarray(array) )
+		os.replace( path+'.tmp', path )
+
+	@staticmethod
+	def load( path, mmap_mode='r' ):
+		''' Opens a file written by save, its arrays memory-mapped with mmap_mode (read into memory if None). '''
+		with open( path, 'rb' ) as scenario_file:
+			header = json.loads( np.lib.format.read_array( scenario_file ).tobytes().decode() )
+			if header['version'] != Scenario.SCENARIO_FILE_VERSION:
+				raise ValueError( 'Scenario file {} has version {}, not {}'.format(path, header['version'], Scenario.SCENARIO_FILE_VERSION) )
+			arrays = { name: _readArrayRecord( scenario_file, path, mmap_mode ) for name in header['arrays'] }
+		scenario = Scenario.fromArrays( np.column_stack( (arrays['x'], arrays['y']) ), arrays['elevation'], header['difficulty'],
+										edge_exists=arrays.get('edge_exists'), cost_matrix=arrays.get('cost_matrix'),
+										sparse=header['sparse'] )
+		scenario._geometric = header['geometric']
+		if 'keep_next' in arrays:
+			scenario._keep_next = arrays['keep_next']
+			scenario._edge_seed = np.uint64( header['edge_seed'] )
+			scenario._removal_fraction = header['removal_fraction']
+		return scenario
+
+	''' <summary>
+		Writes the scenario as a TSPLIB ATSP instance with an explicit FULL_MATRIX of
+		edge weights, one row per line, and the city locations as display data.  TSPLIB
+		has no missing edges, so they (and the diagonal) are written as NO_EDGE.
+		</summary> '''
+	def writeTSPLIB( self, path, name=None ):
+		cost_matrix = self.costMatrix()
+		ncities = len(self._cities)
+		with open( path, 'w' ) as tsplib_file:
+			tsplib_file.write( 'NAME: {}\n'.format( name or os.path.splitext( os.path.basename(path) )[0] ) )
+			tsplib_file.write( 'TYPE: ATSP\n' )
+			tsplib_file.write( 'COMMENT: {} scenario, missing edges cost {}\n'.format( self._difficulty, NO_EDGE ) )
+			tsplib_file.write( 'DIMENSION: {}\n'.format( ncities ) )
+			tsplib_file.write( 'EDGE_WEIGHT_TYPE: EXPLICIT\nEDGE_WEIGHT_FORMAT: FULL_MATRIX\nDISPLAY_DATA_TYPE: TWOD_DISPLAY\n' )
+			tsplib_file.write( 'EDGE_WEIGHT_SECTION\n' )
+			rows = max( 1, self.COST_BLOCK_SIZE // max(ncities,1) )
+			for start in range( 0, ncities, rows ):
+				np.savetxt( tsplib_file, cost_matrix[start:start+rows], fmt='%d' )
+			tsplib_file.write( 'DISPLAY_DATA_SECTION\n' )
+			np.savetxt( tsplib_file, np.column_stack( (np.arange( 1, ncities+1 ), self._x, self._y) ), fmt=['%d', '%.17g', '%.17g'] )
+			tsplib_file.write( 'EOF\n' )
+
+	''' <summary>
+		Reads a TSPLIB TSP or ATSP instance with EXPLICIT, FULL_MATRIX edge weights into
+		a scenario that uses those costs as they are.  Weights of NO_EDGE or more mark
+		missing edges and the diagonal is always missing.  Cities are placed at their
+		display or node coordinates, or evenly around a circle when the file has none.
+		</summary> '''
+	@staticmethod
+	def readTSPLIB( path ):
+		with open( path ) as tsplib_file:
+			parts = re.split( r'^\s*([A-Z_]+_SECTION|EOF)\s*$', tsplib_file.read(), flags=re.MULTILINE )
+		specification = {}
+		for line in parts[0].splitlines():
+			if ':' in line:
+				key, value = line.split( ':', 1 )
+				specification[key.strip().upper()] = value.strip()
+		sections = dict( zip( parts[1::2], parts[2::2] ) )
+		if specification.get('EDGE_WEIGHT_TYPE') != 'EXPLICIT' or specification.get('EDGE_WEIGHT_FORMAT') != 'FULL_MATRIX':
+			raise ValueError( 'Only EXPLICIT FULL_MATRIX TSPLIB instances can be read, not {} {}'.format(
+							  specification.get('EDGE_WEIGHT_TYPE'), specification.get('EDGE_WEIGHT_FORMAT')) )
+		ncities = int( specification['DIMENSION'] )
+		weights = np.fromstring( sections.get('EDGE_WEIGHT_SECTION', ''), dtype=float, sep=' ' )
+		if len(weights) != ncities*ncities:
+			raise ValueError( '{} edge weights for {} cities'.format(len(weights), ncities) )
+		if (weights < 0).any():
+			raise ValueError( 'Negative edge weights are not supported' )
+		cost_matrix = np.minimum( weights, NO_EDGE ).astype( COST_DTYPE ).reshape( ncities, ncities )
+		np.fill_diagonal( cost_matrix, NO_EDGE )
+
+		coordinates = sections.get('DISPLAY_DATA_SECTION', sections.get('NODE_COORD_SECTION'))
+		if coordinates is not None:
+			coordinates = np.fromstring( coordinates, dtype=float, sep=' ' ).reshape( -1, 3 )
+			locations = np.empty( (ncities, 2) )
+			locations[coordinates[:,0].astype(int)-1] = coordinates[:,1:]
+		else:
+			angle = 2*math.pi*np.arange( ncities )/max( ncities, 1 )
+			locations = np.column_stack( (np.cos(angle), np.sin(angle)) )
+
+		missing = isNoEdge( cost_matrix ).sum() > ncities
+		if missing:
+			difficulty = 'Hard'
+		elif np.array_equal( cost_matrix, cost_matrix.T ):
+			difficulty = 'Easy'	# Symmetric, so condensed storage and the symmetric solvers apply
+		else:
+			difficulty = 'Normal'
+		return Scenario.fromArrays( locations, difficulty=difficulty, cost_matrix=cost_matrix )
+
+
+def _readArrayRecord( array_file, path, mmap_mode ):
+	''' The next .npy record in an open file, mapped from path with np.memmap unless mmap_mode is None. '''
+	version = np.lib.format.read_magic( array_file )
+	read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+	shape, fortran_order, dtype = read_header( array_file )
+	offset = array_file.tell()
+	count = int( np.prod( shape, dtype=np.int64 ) )
+	order = 'F' if fortran_order else 'C'
+	if mmap_mode is not None and count > 0:
+		array = np.memmap( path, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape, order=order )
+	else:
+		array = np.fromfile( array_file, dtype=dtype, count=count ).reshape( shape, order=order )
+	array_file.seek( offset + count*dtype.itemsize )
+	return array
+
 
 
 
@@ -161,29 +725,10 @@ class City:
 		Note that this is an asymmetric cost function.
 		 
 		In advanced mode, it returns infinity when there is no connection.
+		The cost is looked up in the scenario's cost matrix (see Scenario.costs).
 		</summary> '''
 	MAP_SCALE = 1000.0
 	def costTo( self, other_city ):
-
-		assert( type(other_city) == City )
-
-		# In hard mode, remove edges; this slows down the calculation...
-		# Use this in all difficulties, it ensures INF for self-edge
-		if not self._scenario._edge_exists[self._index, other_city._index]:
-			#print( 'Edge ({},{}) doesn\'t exist'.format(self._index,other_city._index) )
-			return np.inf
-
-		# Euclidean Distance
-		cost = math.sqrt( (other_city._x - self._x)**2 +
-						  (other_city._y - self._y)**2 )
-
-		# For Medium and Hard modes, add in an asymmetric cost (in easy mode it is zero).
-		if not self._scenario._difficulty == 'Easy':
-			cost += (other_city._elevation - self._elevation)
-			if cost < 0.0:
-				cost = 0.0
-		#cost *= SCALE_FACTOR
-
-
-		return int(math.ceil(cost * self.MAP_SCALE))
+		cost = self._scenario.costs()[self._index, other_city._index]
+		return np.inf if cost == NO_EDGE else int(cost)
 
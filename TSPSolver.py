@@ -16,6 +16,1038 @@ import numpy as np
 from TSPClasses import *
 import heapq
 import itertools
+import collections
+import multiprocessing
+import os
+import json
+import zlib
+import tempfile
+
+
+
+''' <summary>
+	Row then column reduction of an integer cost matrix, in place.  Every row (or just
+	the given row indices) has its smallest edge cost subtracted from all of its edges,
+	then the same is done for the columns.  NO_EDGE entries stay NO_EDGE, and rows or
+	columns with no edge at all are left alone.
+	</summary>
+	<returns>the total amount subtracted, i.e. the increase in the lower bound, or
+	math.inf if dead_is_infeasible and one of the reduced lines had no edge</returns>
+'''
+def reduceCostMatrix( cost_matrix, rows=None, cols=None, dead_is_infeasible=False ):
+	increase = 0
+	for axis, lines in ((1, rows), (0, cols)):
+		if lines is None:
+			block = cost_matrix
+		elif len(lines) == 0:
+			continue
+		else:
+			block = cost_matrix[lines] if axis == 1 else cost_matrix[:,lines]
+		minimums = block.min( axis=axis, keepdims=True )
+		dead = isNoEdge( minimums )
+		if dead.any():
+			if dead_is_infeasible:
+				return math.inf
+			minimums[dead] = 0
+		np.subtract( block, minimums, out=block, where=hasEdge(block) )
+		increase += int( minimums.sum(dtype=np.int64) )
+		if lines is not None:
+			if axis == 1:
+				cost_matrix[lines] = block
+			else:
+				cost_matrix[:,lines] = block
+	return increase
+
+''' <summary>
+	Takes the edge src -> dst in an already reduced cost matrix, in place: row src and
+	column dst become NO_EDGE (as does dst -> path_start, when given, so the path cannot
+	close early).  Only the rows that lost their zero in column dst and the columns that
+	lost their zero in row src (or at dst -> path_start) can have a new minimum, so only
+	those are re-reduced.
+	</summary>
+	<returns>the cost of the edge plus the re-reduction, or math.inf if the edge does
+	not exist or some city is left with no way in or out</returns>
+'''
+def reduceCostMatrixIncremental( cost_matrix, src, dst, path_start=None ):
+	edge_cost = cost_matrix[src, dst]
+	if isNoEdge( edge_cost ):
+		return math.inf
+	rows = np.flatnonzero( cost_matrix[:,dst] == 0 )
+	cols = np.flatnonzero( cost_matrix[src] == 0 )
+	cost_matrix[src,:] = NO_EDGE
+	cost_matrix[:,dst] = NO_EDGE
+	if path_start is not None:
+		if cost_matrix[dst, path_start] == 0:
+			rows = np.append( rows, dst )
+			cols = np.append( cols, path_start )
+		cost_matrix[dst, path_start] = NO_EDGE
+	rows = rows[rows != src]
+	cols = cols[cols != dst]
+	return int(edge_cost) + reduceCostMatrix( cost_matrix, rows, cols, dead_is_infeasible=True )
+
+
+
+
+''' <summary>
+	Nearest-neighbour tours from each of the given start cities at once.  Every step
+	gathers the cost rows of all the current cities, masks out the visited cities and
+	takes the argmin, so a batch of tours costs n vectorized steps.  A tour that reaches
+	a city with no edge to any unvisited city (or back to its start) fails.
+	</summary>
+	<returns>the routes as a (len(starts), n) int array and their costs, with math.inf
+	for the tours that failed</returns>
+'''
+def nearestNeighbourTours( cost_matrix, starts ):
+	starts = np.asarray( starts )
+	ncities = len(cost_matrix)
+	ntours = len(starts)
+	tours = np.arange( ntours )
+	routes = np.empty( (ntours, ncities), dtype=np.int64 )
+	routes[:,0] = starts
+	unvisited = np.ones( (ntours, ncities), dtype=bool )
+	unvisited[tours, starts] = False
+	costs = np.zeros( ntours, dtype=np.int64 )
+	alive = np.ones( ntours, dtype=bool )
+	current = starts
+	for step in range( 1, ncities ):
+		candidates = np.where( unvisited, cost_matrix[current], NO_EDGE )
+		current = candidates.argmin( axis=1 )
+		leg = candidates[tours, current]
+		alive &= hasEdge( leg )
+		costs += leg
+		routes[:,step] = current
+		unvisited[tours, current] = False
+	leg = cost_matrix[current, starts]
+	alive &= hasEdge( leg )
+	costs += leg
+	return routes, np.where( alive, costs, math.inf )
+
+''' <summary>
+	count random tours, sampled as the rows of a 2-D permutation array and costed with
+	one fancy-indexed gather from the cost matrix.
+	</summary>
+	<returns>the permutations and their costs, math.inf for those using a missing edge</returns>
+'''
+def randomTours( cost_matrix, count, rng ):
+	ncities = len(cost_matrix)
+	perms = rng.permuted( np.broadcast_to( np.arange(ncities), (count, ncities) ), axis=1 )
+	legs = cost_matrix[perms, np.roll(perms, -1, axis=1)]
+	feasible = hasEdge( legs ).all( axis=1 )
+	return perms, np.where( feasible, legs.sum( axis=1, dtype=np.int64 ), math.inf )
+
+''' <summary>
+	Randomized nearest-neighbour tours: like nearestNeighbourTours, but every step picks
+	uniformly among the k cheapest edges to unvisited cities instead of the cheapest.
+	</summary>
+'''
+def randomizedNearestNeighbourTours( cost_matrix, starts, k, rng ):
+	starts = np.asarray( starts )
+	ncities = len(cost_matrix)
+	ntours = len(starts)
+	tours = np.arange( ntours )
+	k = max( 1, min(k, ncities) )
+	routes = np.empty( (ntours, ncities), dtype=np.int64 )
+	routes[:,0] = starts
+	unvisited = np.ones( (ntours, ncities), dtype=bool )
+	unvisited[tours, starts] = False
+	costs = np.zeros( ntours, dtype=np.int64 )
+	alive = np.ones( ntours, dtype=bool )
+	current = starts
+	for step in range( 1, ncities ):
+		candidates = np.where( unvisited, cost_matrix[current], NO_EDGE )
+		nearest = np.argpartition( candidates, k-1, axis=1 )[:,:k]
+		nearest_costs = candidates[tours[:,np.newaxis], nearest]
+		order = np.argsort( nearest_costs, axis=1 )	# Cities with an edge come first
+		usable = np.count_nonzero( hasEdge(nearest_costs), axis=1 )
+		pick = (rng.random( ntours ) * np.maximum(usable, 1)).astype( np.int64 )
+		current = nearest[tours, order[tours, pick]]
+		leg = candidates[tours, current]
+		alive &= hasEdge( leg )
+		costs += leg
+		routes[:,step] = current
+		unvisited[tours, current] = False
+	leg = cost_matrix[current, starts]
+	alive &= hasEdge( leg )
+	costs += leg
+	return routes, np.where( alive, costs, math.inf )
+
+def _insertionIncrease( cost_matrix, src, dst, city ):
+	# Extra cost of putting city between src and dst (all broadcast), math.inf if an edge is missing
+	into = cost_matrix[src, city].astype( np.int64 )
+	out = cost_matrix[city, dst].astype( np.int64 )
+	removed = np.where( src == dst, 0, cost_matrix[src, dst] )	# A one-city tour has no edge yet
+	increase = (into + out - removed).astype( float )
+	increase[isNoEdge(into) | isNoEdge(out)] = math.inf
+	return increase
+
+''' <summary>
+	Builds one tour by insertion from the start city.  rule 'cheapest' adds the city
+	(and place) that increases the tour's cost the least; 'farthest' adds the city whose
+	cheapest edge in from the tour is the most expensive, at its cheapest place.  The
+	tour is a successor array, and every unvisited city keeps its cheapest insertion
+	edge, so a step only re-scans the tour for cities whose edge was just split.
+	</summary>
+	<returns>the route as an int array starting at start, and its cost (math.inf, with
+	a None route, if some city could not be inserted)</returns>
+'''
+def insertionTour( cost_matrix, start, rule='cheapest' ):
+	ncities = len(cost_matrix)
+	succ = np.full( ncities, -1 )
+	succ[start] = start
+	unvisited = np.ones( ncities, dtype=bool )
+	unvisited[start] = False
+	tour = [start]
+	cities = np.arange( ncities )
+	best_src = np.full( ncities, start )
+	best_increase = _insertionIncrease( cost_matrix, start, start, cities )
+	distance = cost_matrix[start].astype( np.int64 )	# Cheapest edge from the tour into each city
+	cost = 0
+	for _ in range( ncities-1 ):
+		candidates = np.flatnonzero( unvisited & (best_increase < math.inf) )
+		if len(candidates) == 0:
+			return None, math.inf
+		if rule == 'farthest':
+			city = candidates[ np.argmax( np.where(hasEdge(distance[candidates]), distance[candidates], -1) ) ]
+		else:
+			city = candidates[ np.argmin( best_increase[candidates] ) ]
+		src = best_src[city]
+		dst = succ[src]
+		succ[city] = dst
+		succ[src] = city
+		cost += best_increase[city]
+		unvisited[city] = False
+		tour.append( city )
+		np.minimum( distance, cost_matrix[city], out=distance )
+
+		remaining = np.flatnonzero( unvisited )
+		split = best_src[remaining] == src	# Their cheapest edge src -> dst no longer exists
+		remaining_increase = np.where( split, math.inf, best_increase[remaining] )
+		remaining_src = best_src[remaining]
+		for new_src, new_dst in ( (src, city), (city, dst) ):
+			increase = _insertionIncrease( cost_matrix, new_src, new_dst, remaining )
+			better = increase < remaining_increase
+			remaining_increase[better] = increase[better]
+			remaining_src[better] = new_src
+		best_increase[remaining] = remaining_increase
+		best_src[remaining] = remaining_src
+		rescan = remaining[split]
+		if len(rescan):
+			srcs = np.array( tour )
+			increases = _insertionIncrease( cost_matrix, srcs[np.newaxis,:], succ[srcs][np.newaxis,:], rescan[:,np.newaxis] )
+			best = increases.argmin( axis=1 )
+			best_increase[rescan] = increases[np.arange(len(rescan)), best]
+			best_src[rescan] = srcs[best]
+	route = np.empty( ncities, dtype=np.int64 )
+	city = start
+	for position in range( ncities ):	# Walk the successors to lay the tour out from the start
+		route[position] = city
+		city = succ[city]
+	return route, int(cost)
+
+CONSTRUCTION_METHODS = ( 'nearest', 'knearest', 'farthest', 'cheapest' )
+
+_construction_shared = _construction_costs = None
+
+def _initConstructionWorker( shared ):
+	# shared is a SharedArrays (or any mapping with a 'cost_matrix'), kept
+	# so its views stay attached
+	global _construction_shared, _construction_costs
+	_construction_shared = shared
+	_construction_costs = shared['cost_matrix']
+
+''' <summary>
+	One batch of construction work: nearest-neighbour tours from a range of start
+	cities, randomized nearest-neighbour tours from random starts, or insertion tours
+	from random starts.  Returns the method, the best tour's cost and route, and how
+	many tours were completed.
+	</summary>
+'''
+def _constructionTask( task ):
+	method, first, count, seed, k, deadline = task
+	cost_matrix = _construction_costs
+	ncities = len(cost_matrix)
+	if time.time() >= deadline:
+		return method, math.inf, None, 0
+	rng = np.random.default_rng( seed )
+	if method == 'nearest':
+		routes, costs = nearestNeighbourTours( cost_matrix, np.arange(first, min(first+count, ncities)) )
+	elif method == 'knearest':
+		routes, costs = randomizedNearestNeighbourTours( cost_matrix, rng.integers(0, ncities, count), k, rng )
+	else:
+		routes, costs = [], []
+		for start in rng.integers( 0, ncities, count ):
+			route, cost = insertionTour( cost_matrix, int(start), method )
+			routes.append( route )
+			costs.append( cost )
+			if time.time() >= deadline:
+				break
+		costs = np.array( costs, dtype=float )
+	best = int( np.argmin(costs) )
+	if costs[best] == math.inf:
+		return method, math.inf, None, 0
+	return method, int(costs[best]), np.asarray(routes[best]), int( np.count_nonzero(costs < math.inf) )
+
+''' <summary>
+	Running sums of a tour's edge costs, forwards (fwd[p] is the cost of the first p
+	edges) and backwards (bwd[p] is what they cost walked the other way), so reversing
+	positions i..j changes the cost of the edges inside it by
+	(bwd[j]-bwd[i]) - (fwd[j]-fwd[i]).
+	</summary>
+'''
+def tourEdgeSums( cost_matrix, tour ):
+	succ = np.roll( tour, -1 )
+	fwd = np.concatenate( ([0], np.cumsum( cost_matrix[tour, succ], dtype=np.int64 )) )
+	bwd = np.concatenate( ([0], np.cumsum( cost_matrix[succ, tour], dtype=np.int64 )) )
+	return fwd, bwd
+
+ANNEALING_MOVES = ( 'swap', 'insert', 'insert-back', 'reverse' )
+
+''' <summary>
+	Cost changes of a batch of simulated annealing moves on tour, all computed at once.
+	Move k of kind kinds[k] (an index into ANNEALING_MOVES) changes positions i[k] to
+	j[k], 0 < i < j < n-1: swap exchanges the two cities, insert moves the city at i to
+	just after j, insert-back moves the city at j to just before i, and reverse reverses
+	the segment.
+	</summary>
+'''
+def annealingDeltas( cost_matrix, tour, fwd, bwd, kinds, i, j ):
+	def c( src, dst ):
+		return cost_matrix[src, dst].astype( np.int64 )
+	p, a, a1 = tour[i-1], tour[i], tour[i+1]
+	b0, b, nx = tour[j-1], tour[j], tour[j+1]
+	swap = np.where( j == i+1, c(p,b) + c(b,a) + c(a,nx) - c(a,b),
+					 c(p,b) + c(b,a1) + c(b0,a) + c(a,nx) - c(a,a1) - c(b0,b) )
+	insert = c(p,a1) + c(b,a) + c(a,nx) - c(a,a1)
+	insert_back = c(p,b) + c(b,a) + c(b0,nx) - c(b0,b)
+	reverse = c(p,b) + c(a,nx) + (bwd[j]-bwd[i]) - (fwd[j]-fwd[i])
+	return np.choose( kinds, (swap, insert, insert_back, reverse) ) - c(p,a) - c(b,nx)
+
+def applyAnnealingMove( tour, kind, i, j ):
+	if kind == 0:
+		tour[[i,j]] = tour[[j,i]]
+	elif kind == 3:
+		tour[i:j+1] = tour[i:j+1][::-1].copy()
+	else:
+		tour[i:j+1] = np.roll( tour[i:j+1], -1 if kind == 1 else 1 )
+
+''' <summary>
+	Costs of a population of tours, one row per tour, from a single gather over the
+	cost matrix.  Missing edges count as NO_EDGE, so broken tours rank behind any
+	complete one.
+	</summary>
+'''
+def populationCosts( cost_matrix, tours ):
+	return cost_matrix[tours, np.roll( tours, -1, axis=1 )].sum( axis=1, dtype=np.int64 )
+
+''' <summary>
+	Order crossover (OX) for a batch of parent pairs, the rows of first and second.
+	Each child copies a random slice of its first parent, then fills the rest of its
+	positions, starting after the slice and wrapping around, with the remaining cities
+	in the order the second parent visits them from the same point.
+	</summary>
+'''
+def orderCrossover( first, second, rng ):
+	count, ncities = first.shape
+	rows = np.arange( count )[:,np.newaxis]
+	cuts = np.sort( rng.integers( 0, ncities+1, size=(count, 2) ), axis=1 )
+	positions = np.arange( ncities )
+	inside = (positions >= cuts[:,:1]) & (positions < cuts[:,1:])
+	inherited = np.zeros( first.shape, dtype=bool )
+	inherited[np.nonzero(inside)[0], first[inside]] = True
+	order = (positions + cuts[:,1:]) % ncities
+	donor = second[rows, order]
+	free = ~inside[rows, order]
+	child = first.copy()
+	child[np.nonzero(free)[0], order[free]] = donor[~inherited[rows, donor]]
+	return child
+
+''' <summary>
+	Inversion mutation for a batch of tours: every row gets a random slice reversed.
+	</summary>
+'''
+def invertSegments( tours, rng ):
+	count, ncities = tours.shape
+	cuts = np.sort( rng.integers( 0, ncities, size=(count, 2) ), axis=1 )
+	positions = np.arange( ncities )
+	inside = (positions >= cuts[:,:1]) & (positions <= cuts[:,1:])
+	source = np.where( inside, cuts[:,:1] + cuts[:,1:] - positions, positions )
+	return np.take_along_axis( tours, source, axis=1 )
+
+''' <summary>
+	Runs the genetic algorithm on population for up to generations generations or
+	until the deadline.  Each generation keeps the elite best tours, and breeds the
+	rest from parents picked by two-way tournaments with orderCrossover, inverting a
+	slice of each child with probability mutation.
+	</summary>
+	<returns>the population and its costs, cheapest first, and the generations run</returns>
+'''
+def evolvePopulation( cost_matrix, population, rng, generations, deadline, elite, mutation ):
+	size = len(population)
+	costs = populationCosts( cost_matrix, population )
+	run = 0
+	while run < generations and time.time() < deadline:
+		order = np.argsort( costs, kind='stable' )
+		population, costs = population[order], costs[order]
+		# The population is sorted, so the lower index wins each tournament
+		parents = np.minimum( rng.integers( size, size=(2, size-elite) ), rng.integers( size, size=(2, size-elite) ) )
+		children = orderCrossover( population[parents[0]], population[parents[1]], rng )
+		mutated = rng.random( len(children) ) < mutation
+		children[mutated] = invertSegments( children[mutated], rng )
+		population = np.concatenate( (population[:elite], children) )
+		costs = np.concatenate( (costs[:elite], populationCosts( cost_matrix, children )) )
+		run += 1
+	order = np.argsort( costs, kind='stable' )
+	return population[order], costs[order], run
+
+_genetic_shared = _genetic_costs = None
+
+def _initGeneticWorker( shared ):
+	global _genetic_shared, _genetic_costs
+	_genetic_shared = shared
+	_genetic_costs = shared['cost_matrix']
+
+def _evolveIsland( task ):
+	population, seed, generations, deadline, elite, mutation = task
+	return evolvePopulation( _genetic_costs, population, np.random.default_rng( seed ), generations, deadline, elite, mutation )
+
+''' <summary>
+	One tour per ant for a batch of ants starting at starts, all advancing a step at a
+	time.  Every step each ant moves to an unvisited city with probability proportional
+	to its row of weights (pheromone^alpha * heuristic^beta, zero for missing edges); an
+	ant with nowhere left to go, or no edge home at the end, fails.
+	</summary>
+	<returns>the routes as a (len(starts), n) int array and which of them are complete tours</returns>
+'''
+def antTours( cost_matrix, weights, starts, rng ):
+	ants, ncities = len(starts), len(weights)
+	rows = np.arange( ants )
+	routes = np.empty( (ants, ncities), dtype=np.int64 )
+	routes[:,0] = starts
+	unvisited = np.ones( (ants, ncities), dtype=bool )
+	unvisited[rows, starts] = False
+	alive = np.ones( ants, dtype=bool )
+	current = starts
+	for step in range( 1, ncities ):
+		cumulative = np.cumsum( weights[current] * unvisited, axis=1 )
+		totals = cumulative[:,-1]
+		alive &= totals > 0
+		chosen = ( cumulative <= (rng.random( ants ) * totals)[:,np.newaxis] ).sum( axis=1 )
+		# Failed ants still take some unvisited city, so every route stays a permutation
+		current = np.where( alive & (chosen < ncities), chosen, unvisited.argmax( axis=1 ) )
+		routes[:,step] = current
+		unvisited[rows, current] = False
+	alive &= hasEdge( cost_matrix[current, starts] )
+	return routes, alive
+
+HELD_KARP_CHUNK = 1<<14	# Subsets heldKarpTour extends to a last city at a time
+
+def heldKarpBytes( ncities ):
+	''' Peak memory of heldKarpTour: a cost and a parent for every (subset, last city), the
+		per-subset working arrays, the int64 costs, and the temporaries of the commonest
+		subset size and of one chunk of paths. '''
+	last = max( ncities-1, 0 )
+	widest = math.comb( last, last//2 )
+	chunk = min( widest, HELD_KARP_CHUNK )
+	cost_size = np.dtype(COST_DTYPE).itemsize
+	tables = (1<<last) * last * ( cost_size + np.dtype(np.int8).itemsize ) + ncities * ncities * 8
+	counting = (1<<last) * ( 8 + 1 + 8 + 8 )	# masks and sizes, and two temporaries while counting bits
+	filling = ( (1<<last) * ( 8 + 1 + 8 )		# masks, sizes and by_size
+				+ widest * ( 8 + 8 + 1 + 8 )	# Membership test over one size, and the subsets ending at a city
+				+ chunk * ( last * ( cost_size + 8 + 8 ) + 5 * 8 ) )	# paths, the int64 cast of its gather, and its index temporaries
+	return tables + max( counting, filling )
+
+''' <summary>
+	Held-Karp dynamic programming.  Tours start and end at city 0; best[mask, j] is the
+	cost of the cheapest path from city 0 through exactly the cities in mask (bit j
+	standing for city j+1) ending at city j+1, NO_EDGE if there is none, and parent
+	holds the city before it.  The tables are filled one subset size at a time, each
+	last city's column with min-reductions over HELD_KARP_CHUNK subsets of that size
+	at a time, which keeps the temporaries small next to the tables.
+	</summary>
+	<returns>the optimal route and its cost, (None, math.inf) if there is no tour, or
+	None if the deadline passed first</returns>
+'''
+def heldKarpTour( cost_matrix, deadline ):
+	ncities = len(cost_matrix)
+	if ncities == 1:
+		return np.zeros( 1, dtype=np.int64 ), 0
+	last = ncities-1
+	costs = cost_matrix.astype( np.int64 )
+	best = np.full( (1<<last, last), NO_EDGE, dtype=COST_DTYPE )
+	parent = np.zeros( (1<<last, last), dtype=np.int8 )
+	cities = np.arange( last )
+	best[1<<cities, cities] = cost_matrix[0, 1:]
+	masks = np.arange( 1<<last )
+	sizes = np.zeros( 1<<last, dtype=np.int8 )
+	for city in cities:
+		sizes += (masks >> city) & 1
+	by_size = np.argsort( sizes, kind='stable' )
+	bounds = np.cumsum( np.bincount( sizes, minlength=last+1 ) )
+	for size in range( 2, last+1 ):
+		if time.time() >= deadline:
+			return None
+		subsets = by_size[bounds[size-1]:bounds[size]]
+		for city in cities:
+			ending = subsets[(subsets >> city) & 1 == 1]
+			for start in range( 0, len(ending), HELD_KARP_CHUNK ):
+				chunk = ending[start:start+HELD_KARP_CHUNK]
+				paths = best[chunk ^ (1<<city)] + costs[1:, city+1]
+				before = paths.argmin( axis=1 )
+				best[chunk, city] = np.minimum( paths[np.arange(len(chunk)), before], NO_EDGE )
+				parent[chunk, city] = before
+	full = (1<<last) - 1
+	tours = best[full].astype( np.int64 ) + costs[1:, 0]
+	city = int( tours.argmin() )
+	if isNoEdge( best[full, city] ) or isNoEdge( cost_matrix[city+1, 0] ):
+		return None, math.inf
+	route = []
+	mask = full
+	for step in range( last ):
+		route.append( city+1 )
+		mask, city = mask ^ (1<<city), int( parent[mask, city] )
+	return np.array( [0] + route[::-1] ), int( tours[route[0]-1] )
+
+''' <summary>
+	Nearest-neighbour tour over candidate lists: from city start, each step goes to the
+	first unvisited city on the current city's list (cheapest first), or when they are
+	all visited to one of the next unvisited cities of order, the first of them with an
+	edge from the current city if any.  Costs are only looked up a city at a time, so
+	it suits the LazyCostMatrix of a sparse scenario.
+	</summary>
+'''
+CANDIDATE_TOUR_LOOKAHEAD = 64	# Cities of order candidateTour may look past for an existing edge
+
+def candidateTour( cost_matrix, neighbours, order, start=0 ):
+	ncities = len(neighbours)
+	visited = np.zeros( ncities, dtype=bool )
+	tour = np.empty( ncities, dtype=np.int64 )
+	tour[0] = current = start
+	visited[start] = True
+	fallback = 0
+	for step in range( 1, ncities ):
+		free = neighbours[current][ ~visited[neighbours[current]] ]
+		if len(free):
+			current = free[0]
+		else:
+			while visited[order[fallback]]:
+				fallback += 1
+			ahead = order[fallback:fallback+CANDIDATE_TOUR_LOOKAHEAD]
+			ahead = ahead[ ~visited[ahead] ]
+			reachable = np.flatnonzero( hasEdge( cost_matrix[current, ahead] ) )
+			current = ahead[reachable[0]] if len(reachable) else ahead[0]
+		tour[step] = current
+		visited[current] = True
+	return tour
+
+
+def pathDtype( ncities ):
+	''' Smallest int dtype that can hold a city index. '''
+	return np.int16 if ncities <= np.iinfo(np.int16).max else np.int32
+
+''' <summary>
+	Replays the edges of path on a copy of the root's reduced cost matrix, which gives
+	back the reduced matrix of the search node for that path.
+	</summary>
+'''
+def rebuildReducedMatrix( root_matrix, path ):
+	matrix = root_matrix.copy()
+	for k in range( len(path)-1 ):
+		reduceCostMatrixIncremental( matrix, path[k], path[k+1], path[0] )
+	return matrix
+
+
+''' <summary>
+	One partial tour in the branch-and-bound search.  The path is a small int array of
+	city indices starting at the start city, cost is the plain cost of its edges and
+	visited is the bitmask of the cities on it.  state is what the bound needs to
+	expand the node (the reduced cost matrix, or the assignment), or None when it is
+	to be rebuilt from the root only once the node is expanded (so a queued node
+	costs a few dozen bytes instead of n*n ints).
+	</summary>
+'''
+class SearchNode:
+	__slots__ = ( 'bound', 'depth', 'path', 'cost', 'visited', 'state' )
+	OVERHEAD_BYTES = 320	# Rough size of the object, its ints and the frontier's entry for it
+
+	def __init__( self, bound, path, cost=0, visited=None, state=None ):
+		self.bound = bound
+		self.depth = len(path)
+		self.path = path
+		self.cost = cost
+		self.visited = visited if visited is not None else sum( 1<<int(city) for city in path )
+		self.state = state
+
+	def child( self, city, bound, cost, state=None ):
+		path = np.empty( self.depth+1, dtype=self.path.dtype )
+		path[:-1] = self.path
+		path[-1] = city
+		return SearchNode( bound, path, cost, self.visited | (1<<int(city)), state )
+
+	def nbytes( self ):
+		if self.state is None:
+			state = ()
+		else:
+			state = self.state if isinstance(self.state, tuple) else (self.state,)
+		return self.OVERHEAD_BYTES + self.path.nbytes + sum( part.nbytes for part in state )
+
+
+''' <summary>
+	Lower bounds for branchAndBound.  Each one computes the root's bound and state, and
+	then for a node, its state and a city to extend its path with, the child's bound
+	and state.  A child that closes the tour gets the exact cost of the tour.  rebuild
+	recomputes the state of a node whose state was not kept by replaying its path.
+	</summary>
+'''
+class ReductionBound:
+	# Reduced cost matrix bound: the state is the node's reduced matrix
+	name = 'reduction'
+
+	def __init__( self, edge_costs, start_city=0 ):
+		self.start_city = start_city
+		self.root_state = np.array( edge_costs, dtype=COST_DTYPE )
+		self.root_bound = reduceCostMatrix( self.root_state )
+
+	def child( self, node, state, city ):
+		completes_tour = node.depth+1 == len(state)
+		child_state = state.copy()	# Every child reduces its own copy of the parent's matrix
+		bound = node.bound + reduceCostMatrixIncremental( child_state, node.path[-1], city,
+														  None if completes_tour else self.start_city )
+		if completes_tour:		# Close the tour with the edge back to the start
+			bound += reduceCostMatrixIncremental( child_state, city, self.start_city )
+		return bound, child_state
+
+	def rebuild( self, path ):
+		return rebuildReducedMatrix( self.root_state, path )
+
+class AssignmentBound:
+	''' Assignment problem bound: the cheapest way to give every city that still has to be
+	left a successor, with the current path contracted into a single city.  It is never
+	weaker than the reduction bound and much tighter on asymmetric costs.  The state is
+	the assignment and its dual potentials, which a child updates incrementally: fixing
+	an edge only frees a row or two, which are re-assigned with shortest augmenting
+	paths (Hungarian algorithm) in O(n^2) rather than solving from scratch in O(n^3). '''
+	name = 'assignment'
+
+	def __init__( self, edge_costs, start_city=0 ):
+		self.start_city = start_city
+		self._costs = np.where( isNoEdge(edge_costs), np.inf, edge_costs ).astype( float )
+		ncities = len(edge_costs)
+		u = self._costs.min( axis=1 )
+		u[u == np.inf] = 0.0
+		v = (self._costs - u[:,np.newaxis]).min( axis=0 )
+		v[v == np.inf] = 0.0
+		state = ( u, v, np.full(ncities, -1), np.full(ncities, -1) )
+		active = np.ones( ncities, dtype=bool )
+		for row in range( ncities ):
+			if not self._augment( state, row, active, None ):
+				self.root_state, self.root_bound = None, math.inf
+				return
+		self.root_state = state
+		self.root_bound = self._value( state, active )
+
+	def _value( self, state, active_rows ):
+		rows = np.flatnonzero( active_rows )
+		return int( self._costs[rows, state[2][rows]].sum() )
+
+	def _augment( self, state, row, active_cols, forbid ):
+		''' Assigns the free row along a shortest augmenting path, keeping the potentials
+		a feasible dual.  Returns False when the row cannot be assigned at all. '''
+		u, v, row_to_col, col_to_row = state
+		minv = np.full( len(v), np.inf )
+		way = np.full( len(v), -1 )
+		in_tree = np.zeros( len(v), dtype=bool )
+		searchable = active_cols.copy()
+		tree_rows = [row]
+		current_row, current_col = row, -1
+		while True:
+			reduced = self._costs[current_row] - u[current_row] - v
+			if forbid is not None and current_row == forbid[0]:
+				reduced[forbid[1]] = np.inf
+			better = searchable & (reduced < minv)
+			minv[better] = reduced[better]
+			way[better] = current_col
+			col = int( np.where(searchable, minv, np.inf).argmin() )
+			delta = minv[col]
+			if delta == np.inf or not searchable[col]:
+				return False
+			u[tree_rows] += delta
+			v[in_tree] -= delta
+			minv[searchable] -= delta
+			in_tree[col] = True
+			searchable[col] = False
+			if col_to_row[col] == -1:
+				break
+			current_row, current_col = col_to_row[col], col
+			tree_rows.append( current_row )
+		while col != -1:		# Flip the assignments along the path back to the free row
+			previous = way[col]
+			assigned_row = row if previous == -1 else col_to_row[previous]
+			col_to_row[col] = assigned_row
+			row_to_col[assigned_row] = col
+			col = previous
+		return True
+
+	def _childState( self, state, path, city ):
+		u, v, row_to_col, col_to_row = [part.copy() for part in state]
+		state = ( u, v, row_to_col, col_to_row )
+		last = path[-1]
+		completes_tour = len(path)+1 == len(u)
+		# Row last and column city leave the problem, along with whatever they were assigned
+		for row, col in ( (last, row_to_col[last]), (col_to_row[city], city) ):
+			if row != -1 and col != -1:
+				row_to_col[row] = -1
+				col_to_row[col] = -1
+		forbid = None
+		if not completes_tour:	# city can't go straight back to the start yet
+			forbid = ( city, self.start_city )
+			if row_to_col[city] == self.start_city:
+				row_to_col[city] = -1
+				col_to_row[self.start_city] = -1
+		active_rows = np.ones( len(u), dtype=bool )
+		active_rows[path] = False
+		active_cols = np.ones( len(u), dtype=bool )
+		active_cols[path[1:]] = False
+		active_cols[city] = False
+		for row in np.flatnonzero( active_rows & (row_to_col == -1) ):
+			if not self._augment( state, row, active_cols, forbid ):
+				return None, active_rows
+		return state, active_rows
+
+	def child( self, node, state, city ):
+		child_state, active_rows = self._childState( state, node.path, city )
+		if child_state is None:
+			return math.inf, None
+		path_cost = node.cost + int(self._costs[node.path[-1], city])
+		return path_cost + self._value( child_state, active_rows ), child_state
+
+	def rebuild( self, path ):
+		state = self.root_state
+		for k in range( 1, len(path) ):
+			state, _ = self._childState( state, path[:k], path[k] )
+		return state
+
+LOWER_BOUNDS = { bound.name:bound for bound in (ReductionBound, AssignmentBound) }
+
+''' <summary>
+	Transposition table for branchAndBound.  Two partial paths that visit the same set
+	of cities and end at the same city have exactly the same completions, so only the
+	cheaper one can lead to a better tour.  The table remembers the cheapest cost seen
+	for each (visited bitmask, last city), and evicts the least recently used entries
+	to stay within max_bytes.
+	</summary>
+'''
+class DominanceTable:
+	ENTRY_BYTES = 240	# Rough size of one entry: dict slot, key tuple, bitmask and cost ints
+
+	def __init__( self, max_bytes=64<<20 ):
+		self._table = collections.OrderedDict()
+		self.max_entries = max( 1, max_bytes // self.ENTRY_BYTES )
+		self.dominated = 0
+		self.evictions = 0
+
+	def isDominated( self, visited, last, cost ):
+		''' Records the path unless an equal or cheaper one was already seen. '''
+		key = (visited, int(last))
+		best = self._table.get( key )
+		if best is not None:
+			self._table.move_to_end( key )
+			if best <= cost:
+				self.dominated += 1
+				return True
+		self._table[key] = cost
+		if len(self._table) > self.max_entries:
+			self._table.popitem( last=False )
+			self.evictions += 1
+		return False
+
+	def isStale( self, node ):
+		''' True if a cheaper path to the same state was found after node was queued. '''
+		best = self._table.get( (node.visited, int(node.path[-1])) )
+		return best is not None and best < node.cost
+
+	def counters( self ):
+		return { 'entries':len(self._table), 'dominated':self.dominated, 'evictions':self.evictions }
+
+
+''' <summary>
+	Running sums of an int array kept in blocks of about sqrt(n) entries: the running
+	sum inside each block plus the running sum of the block totals.  Changing a few
+	entries only redoes the blocks they are in and the block totals, and prefix(p), the
+	sum of the first p entries, is still two lookups.
+	</summary>
+'''
+class BlockSums:
+	def __init__( self, values ):
+		n = len(values)
+		self.block = max( 1, math.isqrt( n ) )
+		nblocks = n // self.block + 1	# One more entry than values, so prefix(n) has a block
+		self._grid = np.zeros( (nblocks, self.block), dtype=np.int64 )
+		self.values = self._grid.reshape( -1 )[:n]
+		self.values[:] = values
+		self._within = np.zeros_like( self._grid )
+		self._totals = np.zeros( nblocks, dtype=np.int64 )
+		self._before = np.zeros( nblocks, dtype=np.int64 )
+		self._redo( np.arange( nblocks ) )
+
+	def _redo( self, blocks ):
+		rows = self._grid[blocks]
+		self._within[blocks] = np.cumsum( rows, axis=1 ) - rows
+		self._totals[blocks] = rows.sum( axis=1 )
+		np.cumsum( self._totals[:-1], out=self._before[1:] )
+
+	def set( self, positions, values ):
+		self.values[positions] = values
+		self._redo( np.unique( positions // self.block ) )
+
+	def prefix( self, position ):
+		return self._before[position // self.block] + self._within.reshape( -1 )[position]
+
+	def total( self ):
+		return int( self._before[-1] + self._totals[-1] )
+
+
+''' <summary>
+	2-opt and Or-opt local search over a complete tour, for fancy.  The tour is an int
+	array with pos[city] its position, and the running sums of its edge costs forwards
+	and backwards (see tourEdgeSums), kept as BlockSums so a move updates O(sqrt(n)) of
+	them, make the cost of reversing any segment an O(1) lookup, so asymmetric costs
+	are priced exactly.  Only moves that add an edge from
+	a city to one of its nearest neighbours (Scenario.neighbourLists) are tried, and a
+	city whose neighbourhood gave nothing is skipped (its don't-look bit is set) until
+	a move changes one of its edges.  A missing edge costs NO_EDGE, far more than any
+	finite tour, so the search also works tours that use one back onto real edges.
+	</summary>
+'''
+class LocalSearch:
+	MAX_SEGMENT = 3		# Longest segment Or-opt moves
+
+	def __init__( self, cost_matrix, tour, neighbours ):
+		self.cost_matrix = cost_matrix
+		self.ncities = len(tour)
+		self.neighbours = neighbours
+		self.tour = np.array( tour, dtype=np.int64 )
+		self.pos = np.empty_like( self.tour )
+		self.moves = { '2-opt':0, 'or-opt':0 }
+		self._refresh()
+
+	def _refresh( self ):
+		''' Recomputes pos and the running edge sums for a whole new tour. '''
+		self.pos[self.tour] = np.arange( self.ncities )
+		fwd, bwd = tourEdgeSums( self.cost_matrix, self.tour )
+		self.fwd, self.bwd = BlockSums( np.diff( fwd ) ), BlockSums( np.diff( bwd ) )
+
+	def _replace( self, start, cities ):
+		''' Writes cities into the tour from position start on, looking up only the costs
+			of the edges that touch them and redoing only their blocks of the running sums. '''
+		n = self.ncities
+		positions = (start + np.arange( len(cities) )) % n
+		self.tour[positions] = cities
+		self.pos[cities] = positions
+		edges = (start - 1 + np.arange( len(cities)+1 )) % n
+		src, dst = self.tour[edges], self.tour[(edges+1) % n]
+		self.fwd.set( edges, self.cost_matrix[src, dst] )
+		self.bwd.set( edges, self.cost_matrix[dst, src] )
+
+	def cost( self ):
+		return self.fwd.total()
+
+	def _c( self, *pairs ):
+		''' The costs of several (src, dst) lookups, each broadcast to its own shape, in one
+			indexing of the cost matrix (which matters when every lookup computes costs). '''
+		if isinstance( self.cost_matrix, np.ndarray ):
+			return [np.asarray( self.cost_matrix[src, dst], dtype=np.int64 ) for src, dst in pairs]
+		# Broadcasting each side against the other with 0*other is far cheaper than np.broadcast_to
+		srcs = [np.asarray( src ) + 0*np.asarray( dst ) for src, dst in pairs]
+		dsts = [np.asarray( dst ) + 0*np.asarray( src ) for src, dst in pairs]
+		costs = np.asarray( self.cost_matrix[np.concatenate( [src.ravel() for src in srcs] ),
+											 np.concatenate( [dst.ravel() for dst in dsts] )], dtype=np.int64 )
+		ends = np.cumsum( [src.size for src in srcs] )
+		return [costs[end-src.size:end].reshape( src.shape ) for end, src in zip( ends, srcs )]
+
+	def _span( self, sums, start, end ):
+		''' Cost of the edges from position start to position end, wrapping around the tour. '''
+		return sums.prefix( end ) - sums.prefix( start ) + np.where( start <= end, 0, sums.total() )
+
+	def _city( self, position ):
+		return self.tour[position % self.ncities]
+
+	def _reverse( self, start, end ):
+		self._replace( start, self._city( start + np.arange( (end-start) % self.ncities + 1 ) )[::-1] )
+
+	def _moveSegment( self, start, length, before, reverse ):
+		''' Moves the segment of length cities at position start to just before city before,
+			shifting whichever side of the tour between them is shorter. '''
+		segment = self._city( start + np.arange( length ) )
+		if reverse:
+			segment = segment[::-1]
+		at = self.pos[before]
+		ahead, behind = (at-start) % self.ncities - length, (start-at) % self.ncities
+		if ahead <= behind:
+			self._replace( start, np.concatenate( (self._city( start + length + np.arange( ahead ) ), segment) ) )
+		else:
+			self._replace( at, np.concatenate( (segment, self._city( at + np.arange( behind ) )) ) )
+
+	def twoOpt( self, a ):
+		''' Best improving 2-opt move adding the edge a->c; returns the cities whose edges changed. '''
+		i = self.pos[a]
+		p, b = self._city( i-1 ), self._city( i+1 )
+		cs = self.neighbours[a]
+		j = self.pos[cs]
+		d, e = self._city( j+1 ), self._city( j-1 )
+		after, before = (i+1) % self.ncities, (j-1) % self.ncities
+		ab, cd, ac, bd, pa, ec, pe = self._c( (a,b), (cs,d), (a,cs), (b,d), (p,a), (e,cs), (p,e) )
+		# Reverse b..c, giving a->c and b->d
+		gain_after = ab + cd - ac - bd + self._span( self.fwd, after, j ) - self._span( self.bwd, after, j )
+		# Reverse a..e, giving p->e and a->c
+		gain_before = pa + ec - pe - ac + self._span( self.fwd, i, before ) - self._span( self.bwd, i, before )
+		best_after, best_before = int( gain_after.argmax() ), int( gain_before.argmax() )
+		if max( gain_after[best_after], gain_before[best_before] ) <= 0:
+			return None
+		self.moves['2-opt'] += 1
+		if gain_after[best_after] >= gain_before[best_before]:
+			self._reverse( after, j[best_after] )
+			return (a, b, cs[best_after], d[best_after])
+		self._reverse( i, before[best_before] )
+		return (p, a, e[best_before], cs[best_before])
+
+	def orOpt( self, a ):
+		''' Best improving move of a segment ending (or, reversed, starting) at a to just before
+			one of a's neighbours d; returns the cities whose edges changed. '''
+		n = self.ncities
+		i = self.pos[a]
+		ds = self.neighbours[a]
+		jd = self.pos[ds]
+		cs = self._city( jd-1 )
+		cd, ad = self._c( (cs,ds), (a,ds) )
+		best = (0, None)
+		for length in range( 1, min( self.MAX_SEGMENT, n-3 ) + 1 ):
+			# Segment s1..a keeps its direction: p->nx, c->s1 and a->d
+			start = (i-length+1) % n
+			s1, p, nx = self.tour[start], self._city( start-1 ), self._city( i+1 )
+			ps, an, pn, cs1 = self._c( (p,s1), (a,nx), (p,nx), (cs,s1) )
+			gain = ps + an + cd - pn - cs1 - ad
+			gain = np.where( (jd-start) % n > length, gain, 0 )
+			if gain.max() > best[0]:
+				best = (gain.max(), (start, length, int( gain.argmax() ), False, (p, s1, a, nx)))
+			if length == 1:
+				continue
+			# Segment a..se is reversed: p->nx, c->se and a->d
+			end = (i+length-1) % n
+			se, p, nx = self.tour[end], self._city( i-1 ), self._city( i+length )
+			pa, sn, pn, cse = self._c( (p,a), (se,nx), (p,nx), (cs,se) )
+			gain = pa + sn + cd - pn - cse - ad + self._span( self.fwd, i, end ) - self._span( self.bwd, i, end )
+			gain = np.where( (jd-i) % n > length, gain, 0 )
+			if gain.max() > best[0]:
+				best = (gain.max(), (i, length, int( gain.argmax() ), True, (p, a, se, nx)))
+		if best[1] is None:
+			return None
+		start, length, k, reverse, ends = best[1]
+		self.moves['or-opt'] += 1
+		self._moveSegment( start, length, ds[k], reverse )
+		return ends + (cs[k], ds[k])
+
+	def improveCity( self, a ):
+		return self.twoOpt( a ) or self.orOpt( a )
+
+	def improve( self, deadline, cities=None ):
+		''' Applies improving moves until no city finds one or the deadline passes. '''
+		if self.ncities < 3:	# Every tour of one or two cities is the same tour
+			return True
+		if cities is None:
+			# Cities on either end of a missing edge go first
+			broken = isNoEdge( self.fwd.values )
+			broken |= np.roll( broken, 1 )
+			cities = np.concatenate( (self.tour[broken], self.tour[~broken]) )
+		queue = collections.deque( cities )
+		queued = np.zeros( self.ncities, dtype=bool )
+		queued[queue] = True
+		while queue and time.time() < deadline:
+			a = queue.popleft()
+			queued[a] = False
+			changed = self.improveCity( a )
+			for city in changed or ():
+				if not queued[city]:
+					queued[city] = True
+					queue.append( city )
+		return not queue
+
+	def reset( self, tour ):
+		self.tour = np.array( tour, dtype=np.int64 )
+		self._refresh()
+
+
+''' <summary>
+	Lin-Kernighan style improvement for linKernighan: LocalSearch plus sequential
+	3-opt segment exchange, which swaps two adjacent segments without reversing either
+	(so it costs the same whichever way the costs are asymmetric), and iterated local
+	search around it.  Each kick is a random double bridge on nearby segments, after
+	which only the cities around the kick are searched; the result is kept if it is
+	cheaper and undone otherwise.
+	</summary>
+'''
+class LinKernighanSearch( LocalSearch ):
+	KICK_SEGMENT = 50	# Longest segment a double-bridge kick moves
+
+	def __init__( self, cost_matrix, tour, neighbours ):
+		LocalSearch.__init__( self, cost_matrix, tour, neighbours )
+		self.moves['3-opt'] = 0
+		self.kicks = 0
+
+	def _exchange( self, i, first, second ):
+		''' Turns a b..c d..e f into a d..e b..c f, where b and d are first and second cities after
+			position i and f is at offset second (f is a itself when second is the tour length). '''
+		cities = self._city( i + 1 + np.arange( second-1 ) )
+		self._replace( i+1, np.concatenate( (cities[first-1:], cities[:first-1]) ) )
+
+	def segmentExchange( self, a ):
+		''' Best improving sequential 3-opt move adding a->d and c->f, with c = pred(d), d a
+			neighbour of a and f a neighbour of c; returns the cities whose edges changed. '''
+		n = self.ncities
+		i = self.pos[a]
+		b = self._city( i+1 )
+		ds = self.neighbours[a]
+		cs = self._city( self.pos[ds]-1 )
+		fs = self.neighbours[cs]
+		es = self._city( self.pos[fs]-1 )
+		first = (self.pos[ds]-i-1) % n + 1
+		second = (self.pos[fs]-i-1) % n + 1
+		ab, cd, ad, ef, eb, cf = self._c( (a,b), (cs,ds), (a,ds), (es,fs), (es,b), (cs[:,np.newaxis],fs) )
+		gain = ab + (cd - ad)[:,np.newaxis] + ef - eb - cf
+		gain = np.where( (first[:,np.newaxis] >= 2) & (second > first[:,np.newaxis]), gain, 0 )
+		best = np.unravel_index( gain.argmax(), gain.shape )
+		if gain[best] <= 0:
+			return None
+		self.moves['3-opt'] += 1
+		self._exchange( i, first[best[0]], second[best] )
+		return (a, b, cs[best[0]], ds[best[0]], es[best], fs[best])
+
+	def improveCity( self, a ):
+		return self.twoOpt( a ) or self.orOpt( a ) or self.segmentExchange( a )
+
+	def kick( self, rng ):
+		''' Double bridge: swaps two random adjacent segments; returns the cities whose edges changed. '''
+		n = self.ncities
+		i = int( rng.integers( n ) )
+		lengths = rng.integers( 1, max( 1, min( self.KICK_SEGMENT, (n-2)//2 ) ) + 1, size=2 )
+		first, second = 1 + int(lengths[0]), 1 + int(lengths.sum())
+		ends = ( self._city(i), self._city(i+1), self._city(i+first-1), self._city(i+first),
+				 self._city(i+second-1), self._city(i+second) )
+		self.kicks += 1
+		self._exchange( i, first, second )
+		return ends
+
+	def iterate( self, deadline, rng ):
+		''' Local search, then kicks until the deadline, keeping the cheapest tour found. '''
+		self.improve( deadline )
+		best_tour, best_cost = self.tour.copy(), self.cost()
+		while self.ncities >= 8 and time.time() < deadline:
+			self.improve( deadline, self.kick( rng ) )
+			if self.cost() < best_cost:
+				best_tour, best_cost = self.tour.copy(), self.cost()
+			else:
+				self.reset( best_tour )
+		self.reset( best_tour )
+
 
 
 
@@ -27,10 +1059,13 @@ class TSPSolver:
 		self._scenario = scenario
 
 
+	RANDOM_TOUR_BLOCK_ELEMENTS = 1<<20	# Cities sampled per block of random permutations
+
 	''' <summary>
 		This is the entry point for the default solver
 		which just finds a valid random tour.  Note this could be used to find your
-		initial BSSF.
+		initial BSSF.  Permutations are sampled and checked in blocks, and with best_of
+		the best of that many valid tours is returned instead of the first one.
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of solution, 
 		time spent to find solution, number of permutations tried during search, the 
@@ -38,28 +1073,32 @@ class TSPSolver:
 		algorithm</returns> 
 	'''
 	
-	def defaultRandomTour( self, time_allowance=60.0 ):
+	def defaultRandomTour( self, time_allowance=60.0, best_of=1, seed=None ):
 		results = {}
 		cities = self._scenario.getCities()
 		ncities = len(cities)
-		foundTour = False
+		cost_matrix = self._scenario.costs()	# Random tours only gather their own legs
+		rng = np.random.default_rng( seed )
+		block = max( 1, self.RANDOM_TOUR_BLOCK_ELEMENTS // max(ncities,1) )
+		found = 0
 		count = 0
+		best_cost = math.inf
 		bssf = None
 		start_time = time.time()
-		while not foundTour and time.time()-start_time < time_allowance:
-			# create a random permutation
-			perm = np.random.permutation( ncities )
-			route = []
-			# Now build the route using the random permutation
-			for i in range( ncities ):
-				route.append( cities[ perm[i] ] )
-			bssf = TSPSolution(route)
-			count += 1
-			if bssf.cost < np.inf:
-				# Found a valid route
-				foundTour = True
+		while found < best_of and time.time()-start_time < time_allowance:
+			# create a block of random permutations and cost them all at once
+			perms, costs = randomTours( cost_matrix, block, rng )
+			feasible = np.flatnonzero( costs < math.inf )[:best_of-found]
+			count += int(feasible[-1])+1 if found+len(feasible) == best_of else block
+			found += len(feasible)
+			if len(feasible) and costs[feasible].min() < best_cost:
+				best = feasible[ costs[feasible].argmin() ]
+				best_cost = costs[best]
+				bssf = perms[best]
+		if bssf is not None:	# Build the route using the best random permutation
+			bssf = TSPSolution.fromTour( self._scenario, bssf )
 		end_time = time.time()
-		results['cost'] = bssf.cost if foundTour else math.inf
+		results['cost'] = bssf.cost if bssf else math.inf
 		results['time'] = end_time - start_time
 		results['count'] = count
 		results['soln'] = bssf
@@ -74,247 +1113,1043 @@ class TSPSolver:
 		the group project (but it is probably a good idea to just do it for the branch-and
 		bound project as a way to get your feet wet).  Note this could be used to find your
 		initial BSSF.
+		The tour is built from every start city (or just the given starts) and the best
+		one is kept; starts are processed in batches, so a large scenario simply gets
+		fewer starts within time_allowance.
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
 		time spent to find best solution, total number of solutions found, the best
 		solution found, and three null values for fields not used for this 
 		algorithm</returns> 
 	'''
-	def greedy( self,time_allowance=60.0 ):
+	GREEDY_BATCH_ELEMENTS = 1<<16	# Cost-matrix entries gathered per step of a greedy batch
+	def greedy( self,time_allowance=60.0, starts=None ):
 		results = {}
 		cities = self._scenario.getCities()
 		ncities = len(cities)
-		foundTour = False
+		cost_matrix = self._scenario.costMatrix()
 		count = 0
 		bssf = None
+		best_cost = math.inf
 		start_time = time.time()
-		start_city_index = 0
-		while start_city_index <= ncities-1 and time.time()-start_time < time_allowance:
-			start_city = cities[start_city_index]
-			route = [start_city]
-
-			current_city = start_city
-			if(start_city_index < ncities-1):
-				next_city = cities[start_city_index + 1]
-			keep_looking = True
-			while len(route) < ncities and time.time()-start_time < time_allowance and keep_looking:
-				for city in cities:
-					if(city not in route and current_city.costTo(city) != np.inf):
-						if(current_city.costTo(next_city) > current_city.costTo(city)):
-							next_city = city
-				if(current_city.costTo(next_city) == np.inf):
-					keep_looking = False
-				else:
-					route.append(next_city)
-					current_city = next_city
-			if route[-1].costTo(route[0]) != np.inf and bssf == None and len(route) == ncities:
-				bssf = TSPSolution(route)
-				count += 1
-				foundTour = True
-			elif route[-1].costTo(route[0]) != np.inf and len(route) == ncities:
-				newBssf = TSPSolution(route)
-				if newBssf.cost < bssf.cost:
-					bssf = newBssf
-				count += 1
-				foundTour = True
-			start_city_index += 1
+		if starts is None:		# Try every start city, as time allows
+			starts = np.arange( ncities )
+		# The first tour is built alone so there is a BSSF quickly, the rest in batches
+		batch = max( 1, self.GREEDY_BATCH_ELEMENTS // max(ncities,1) )
+		batches = [starts[:1]] + [starts[first:first+batch] for first in range(1, len(starts), batch)]
+		for batch_starts in batches:
+			if time.time()-start_time >= time_allowance:
+				break
+			routes, costs = nearestNeighbourTours( cost_matrix, batch_starts )
+			count += int( np.count_nonzero(costs < math.inf) )
+			best = int( costs.argmin() )
+			if costs[best] < best_cost:
+				best_cost = costs[best]
+				bssf = TSPSolution.fromTour( self._scenario, routes[best] )
 		end_time = time.time()
-		results['cost'] = bssf.cost if foundTour else math.inf
+		results['cost'] = bssf.cost if bssf else math.inf
 		results['time'] = end_time - start_time
 		results['count'] = count
 		results['soln'] = bssf
 		results['max'] = None
 		results['total'] = None
 		results['pruned'] = None
-		results['path'] = route
+		results['path'] = bssf.route if bssf else None
 		return results
 	
 	
+	''' <summary>
+		Multi-start construction: nearest-neighbour tours from every start city, plus
+		randomized constructions (nearest-neighbour choosing among the k nearest cities,
+		farthest insertion and cheapest insertion from random starts), for as long as
+		time_allowance lasts.  The work is split into small batches that are spread over
+		a process pool (processes=None for one per CPU, 1 to stay in this process).
+		</summary>
+		<returns>results dictionary for GUI with the cost of the best tour, the time spent,
+		the number of tours built, the best tour, the method that built it and the number
+		of tours built by each method</returns> 
+	'''
+	CONSTRUCTION_TASKS_PER_PROCESS = 64	# Batches of randomized tours per method and process
+	def constructionHeuristics( self, time_allowance=60.0, methods=CONSTRUCTION_METHODS, processes=None, k=3, seed=None ):
+		results = {}
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		cost_matrix = self._scenario.costMatrix()
+		start_time = time.time()
+		deadline = start_time + time_allowance
+		processes = processes or os.cpu_count()
+		batch = max( 1, self.GREEDY_BATCH_ELEMENTS // max(ncities,1) )
+		seeds = np.random.SeedSequence( seed )
+		queues = []
+		for method in methods:
+			if method == 'nearest':
+				queues.append( [(method, first, batch, None, k, deadline) for first in range(0, ncities, batch)] )
+			else:
+				count = batch if method == 'knearest' else max( 1, (1<<14) // max(ncities,1) )
+				queues.append( [(method, 0, count, child, k, deadline)
+								for child in seeds.spawn( self.CONSTRUCTION_TASKS_PER_PROCESS*processes )] )
+		# Interleave the methods so each gets its share before the deadline
+		tasks = [task for tasks in itertools.zip_longest( *queues ) for task in tasks if task is not None]
+
+		best_cost, best_route, best_method = math.inf, None, None
+		built = { method:0 for method in methods }
+		pool = shared = None
+		try:
+			if processes == 1:
+				_initConstructionWorker( {'cost_matrix': cost_matrix} )
+				outcomes = map( _constructionTask, tasks )
+			else:
+				# The workers share one copy of the costs instead of unpickling their own
+				shared = SharedArrays.forPool( cost_matrix=cost_matrix )
+				pool = multiprocessing.Pool( processes, initializer=_initConstructionWorker, initargs=(shared,) )
+				outcomes = pool.imap_unordered( _constructionTask, tasks )
+			for method, cost, route, count in outcomes:
+				built[method] += count
+				if cost < best_cost:
+					best_cost, best_route, best_method = cost, route, method
+		finally:
+			if pool is not None:
+				pool.terminate()
+			if shared is not None:
+				shared.close()
+		bssf = TSPSolution.fromTour( self._scenario, best_route ) if best_route is not None else None
+		end_time = time.time()
+		results['cost'] = bssf.cost if bssf else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = sum( built.values() )
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		results['method'] = best_method
+		results['tours'] = built
+		return results
+
+
 	''' <summary>
 		This is the entry point for the branch-and-bound algorithm that you will implement
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
 		time spent to find best solution, total number solutions found during search (does
 		not include the initial BSSF), the best solution found, and three more ints: 
-		max queue size, total number of states created, and number of pruned states.</returns> 
+		max queue size, total number of states created, and number of pruned states.
+		The frontier strategy used (strategy: one of FRONTIER_STRATEGIES) and its counters
+		are reported too, as are those of the dominance table (dominance_bytes=0 turns
+		it off).  Dominated states count as pruned.  bound picks the lower bound from
+		LOWER_BOUNDS, or 'auto' for the assignment bound on asymmetric scenarios.
+		With processes other than 1 (None for one per CPU) the subtrees are searched by a
+		process pool, and the counters are merged over all of the workers.
+		The search stops at time_allowance.  If it had to stop with states left, they are
+		saved with the BSSF and the counters to the checkpoint file when one is given,
+		and a later call with resume set to that file carries on where it left off.
+		'complete' in the results says whether the search finished without throwing any
+		states away, so a beam search that dropped states never counts as complete (its
+		tour may not be optimal) even once its frontier runs dry.  With memory_bytes
+		set, the frontier spills its worst nodes to run files in spill_dir (the system
+		temporary directory by default) rather than growing past that budget.</returns> 
 	'''
 		
-	def branchAndBound( self, time_allowance=60.0 ):
+	def branchAndBound( self, time_allowance=60.0, strategy='best', beam_width=1000, bound='reduction',
+						keep_states=False, dominance_bytes=64<<20, processes=1, checkpoint=None, resume=None,
+						memory_bytes=None, spill_dir=None ):
 		results = {}
 		cities = self._scenario.getCities()
-		ncities = len(cities)
+		edge_costs = self._scenario.costMatrix()
 		start_time = time.time()
-		bssf = self.greedy()	# Initially run the greedy approach to find the initiall bssf
-		bssf_soln = bssf['soln']
-		bssf_cost = bssf['cost']
-		max_queue_size = 0
-		pruned = 0
-		count = 0
-		solutions = 0
-		
-		cost_matrix_initial = []	# Creating our cost matrix
-		for temp_city in cities:
-			temp_matrix = []
-			for target_city in cities:
-				temp_matrix.append(temp_city.costTo(target_city))
-			cost_matrix_initial.append(temp_matrix)
-		pq = []
-		heapq.heapify(pq)
-		lower_bound = 0		# Finding the initial lower bound
-		lower_bound, cost_matrix = self.findInitialLowerBoundReduceMatrix(lower_bound,cost_matrix_initial)	# gives us our initial lower bound and reduces the cost matrix
-		start_city = cities[0]	# We will always start at the first city in the array
-		visited_cities = [start_city]
-		heapq.heappush(pq, (lower_bound, cost_matrix_initial, visited_cities))
-		while len(pq) != 0:
-			problem = heapq.heappop(pq)
-			current_city = problem[2][-1]	# Our current city is always going to be the last element that we added to our visited cities
-			visited_cities_copy = problem[2]
-			current_city_index = cities.index(current_city)
-			for i in range(len(cities)):	# This cycles through all of the available cities
-				visited_cities = visited_cities_copy.copy()
-				if(current_city.costTo(cities[i]) != np.inf and cities[i] not in visited_cities):	# If the cost to get to the next city isnt infinite and hasnt been visited, we visit
-					visited_cities.append(cities[i])
-					count += 1
-					if len(pq) > max_queue_size:	# Updating the max queue size
-						max_queue_size = len(pq)
-					new_lower_bound,new_cost_matrix = self.findLowerBoundReduceMatrix(lower_bound,cost_matrix, current_city_index, i)	# Calculating the updated lower bound and cost matrix
-					if len(visited_cities) == len(cities) and new_lower_bound < bssf_cost:
-						bssf_cost = new_lower_bound
-						bssf_soln = TSPSolution(visited_cities)	# Creating a new solution if we found one and updating our number of solutions
-						solutions += 1
-					elif new_lower_bound <= bssf_cost:
-						heapq.heappush(pq, (new_lower_bound, new_cost_matrix, visited_cities))	# Pushing a new element into the pq
-					else:
-						pruned += 1	# Updates our pruned nodes
-				else:	# If the cost to the city is infinite and it is not in the visited cities, we can prune it
-					pruned += 1
+		deadline = start_time + time_allowance
+		bssf = self.greedy( time_allowance )	# Initially run the greedy approach to find the initiall bssf
+		if bound == 'auto':
+			bound = ReductionBound.name if self._scenario.isSymmetric() else AssignmentBound.name
+		search = BranchAndBoundSearch( edge_costs, strategy=strategy, beam_width=beam_width,
+									   bound=bound, keep_states=keep_states, dominance_bytes=dominance_bytes,
+									   memory_bytes=memory_bytes, spill_dir=spill_dir )
+		search.best_cost = bssf['cost']
+		nodes, saved_counters = None, None
+		if resume is not None:
+			nodes, best_cost, best_path, saved_counters = BranchAndBoundSearch.loadCheckpoint( resume, edge_costs )
+			if best_path is not None and best_cost < search.best_cost:
+				search.best_cost, search.best_path = best_cost, best_path
+		if processes == 1:
+			unfinished = search.run( nodes or [search.root()], deadline )
+			counters = search.counters()
+		else:
+			unfinished, counters = search.runParallel( processes, nodes, deadline )
+		if saved_counters is not None:
+			_mergeSearchCounters( saved_counters, counters )
+			saved_counters['processes'] = counters['processes']
+			counters = saved_counters
+		if checkpoint is not None and unfinished:
+			search.saveCheckpoint( checkpoint, unfinished, counters )
+		bssf_soln = TSPSolution.fromTour( self._scenario, search.best_path ) if search.best_path is not None else bssf['soln']
 		end_time = time.time()
 		
-		results['cost'] = bssf_soln.cost 
+		results['cost'] = bssf_soln.cost if bssf_soln else math.inf
 		results['time'] = end_time - start_time
-		results['count'] = count
+		results['count'] = counters['solutions']
 		results['soln'] = bssf_soln
-		results['max'] = max_queue_size
-		results['total'] = solutions
-		results['pruned'] = pruned
+		results['max'] = counters['max']
+		results['total'] = counters['total']
+		results['pruned'] = counters['pruned']
+		results['strategy'] = strategy
+		results['bound'] = bound
+		results['frontier'] = counters['frontier']
+		results['dominance'] = counters['dominance']
+		results['processes'] = counters['processes']
+		results['complete'] = not unfinished and counters['frontier']['dropped'] == 0
+		results['checkpoint'] = checkpoint if checkpoint is not None and unfinished else None
 		return results
 
 
-	def findInitialLowerBoundReduceMatrix(self, lower_bound, cost_matrix):
-		for i in range(len(cost_matrix)):
-			lowest_row_cost = np.inf
-			for j in range(len(cost_matrix[i])):
-				if cost_matrix[i][j] < lowest_row_cost:
-					lowest_row_cost = cost_matrix[i][j]	# Finding the lowest cost for each row
-			for j in range(len(cost_matrix[i])):
-				if(cost_matrix[i][j] != np.inf):
-					cost_matrix[i][j] -= lowest_row_cost	# Reducing the cost matrix and updating the lower bound
-			lower_bound += lowest_row_cost
-		for i in range(len(cost_matrix)):
-			lowest_column_cost = np.inf
-			for j in range(len(cost_matrix[i])):
-				if cost_matrix[j][i] < lowest_column_cost:
-					lowest_column_cost = cost_matrix[j][i]	# Finding the lowest column cost
-			for j in range(len(cost_matrix[i])):	# Reducing the columns
-				if(cost_matrix[j][i] != np.inf):
-					cost_matrix[j][i] -= lowest_column_cost	# Updating the cost matrix and updating the lower bound
-			lower_bound+= lowest_column_cost
-		return lower_bound, cost_matrix
-
-	def findLowerBoundReduceMatrix(self, lower_bound, cost_matrix, start_city_index, destination_city_index):
-		lower_bound += cost_matrix[destination_city_index][start_city_index]
-		cost_matrix[start_city_index][destination_city_index] = np.inf	# Source and destination nodes to inf in the cost matrix
-		cost_matrix[destination_city_index][start_city_index] = np.inf
-		for i in range(len(cost_matrix)):	# Updating the cost matrix rows and columns
-			cost_matrix[start_city_index][i] = np.inf
-			cost_matrix[i][destination_city_index] = np.inf
-		for i in range(len(cost_matrix)):
-			lowest_row_cost = np.inf
-			for j in range(len(cost_matrix[i])):
-				if cost_matrix[i][j] < lowest_row_cost:
-					lowest_row_cost = cost_matrix[i][j]	# Finding the lowest cost for each row
-			for j in range(len(cost_matrix[i])):
-				if(cost_matrix[i][j] != np.inf):
-					cost_matrix[i][j] -= lowest_row_cost # Updating the cost matrix
-			lower_bound += lowest_row_cost
-		for i in range(len(cost_matrix)):
-			lowest_column_cost = np.inf
-			for j in range(len(cost_matrix[i])):
-				if cost_matrix[j][i] < lowest_column_cost and cost_matrix[j][i] != np.inf:
-					lowest_column_cost = cost_matrix[j][i]	# Finding the lowest cost for each row
-			for j in range(len(cost_matrix[i])):
-				if(cost_matrix[j][i] != np.inf):
-					cost_matrix[j][i] -= lowest_column_cost	# Updating the cost matrix
-			if lowest_column_cost != np.inf:
-				lower_bound += lowest_column_cost	# Updating the lower bound
-		return lower_bound, cost_matrix
-	'''
-	def findLowerBoundReduceMatrix(self, lower_bound, cost_matrix, isFirstCalculation):
-		lowest_row_cost_list = []
-		for i in range(len(cost_matrix)):
-			lowest_row_cost = np.inf
-			for j in range(len(cost_matrix[i])):
-				if cost_matrix[i][j] < lowest_row_cost:
-					lowest_row_cost = cost_matrix[i][j]	# Finding the lowest cost for each row
-			for j in range(len(cost_matrix[i])):
-				if(cost_matrix[i][j] != np.inf):
-					cost_matrix[i][j] -= lowest_row_cost
-			lowest_row_cost_list.append(lowest_row_cost)
-			if lowest_row_cost == np.inf and isFirstCalculation:
-				lower_bound += lowest_row_cost	# Updating the lower bound
-			elif lowest_row_cost == np.inf and isFirstCalculation == False:
-				continue	# If the lowest row cost is infinity and it isnt the first time we are calculating the reduced matrix, we can just continue
-			else:
-				lower_bound += lowest_row_cost	# Updating the lower bound
-		
-		lowest_column_cost_list = []	# Reducing the columns
-		for i in range(len(cost_matrix)):
-			lowest_column_cost = np.inf
-			for j in range(len(cost_matrix[i])):
-				if cost_matrix[j][i] < lowest_column_cost:
-					lowest_column_cost = cost_matrix[j][i]	# Reducing the rows
-			#print(cost_matrix)
-			if lowest_column_cost == np.inf and isFirstCalculation:
-				lower_bound += lowest_column_cost	# Updating the lower bound
-			elif lowest_column_cost == np.inf and isFirstCalculation == False:	# If the lowest column cost is infinity and 
-				continue														# it isnt the first time we are calculating the reduced matrix, we can just continue
-			else:
-				lower_bound += lowest_column_cost
-			for j in range(len(cost_matrix[i])):	# Reducing the columns
-				if(cost_matrix[j][i] != np.inf):
-					cost_matrix[j][i] -= lowest_column_cost
-		return lower_bound, cost_matrix
-	'''
-
-
 
 
 
 	'''
 	 <summary>
 		This is the entry point for the algorithm you'll write for your group project.
+		Local search: the best of a batch of greedy tours is improved with 2-opt and
+		Or-opt moves (see LocalSearch) over each city's cheapest neighbours until no
+		move helps or time runs out.
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
 		time spent to find best solution, total number of solutions found during search, the 
 		best solution found.  You may use the other three field however you like.
+		Here count is the number of improving moves made, and moves splits it by kind.
 		algorithm</returns> 
 	'''
 		
-	def fancy( self,time_allowance=60.0 ):
-		pass
+	NEIGHBOURS = 8	# Candidate edges per city for local search
+	def fancy( self,time_allowance=60.0, neighbours=NEIGHBOURS ):
+		results = {}
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		cost_matrix = self._scenario.costs()
+		start_time = time.time()
+		neighbours = self._scenario.neighbourLists( neighbours )
+		search = LocalSearch( cost_matrix, self._startTour( cost_matrix, neighbours ), neighbours )
+		search.improve( start_time + time_allowance )
+		bssf = TSPSolution.fromTour( self._scenario, search.tour )
+		end_time = time.time()
+		results['cost'] = bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = sum( search.moves.values() )
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		results['moves'] = search.moves
+		return results
+
+	def _startTour( self, cost_matrix, neighbours=None ):
+		''' The best of a batch of nearest-neighbour tours, or a random tour if they all fail.
+			Without a dense matrix (a sparse scenario) it is one candidateTour instead. '''
+		ncities = len(cost_matrix)
+		if not isinstance( cost_matrix, np.ndarray ):
+			if neighbours is None:
+				neighbours = self._scenario.neighbourLists( self.NEIGHBOURS )
+			return candidateTour( cost_matrix, neighbours, self._scenario.spatialOrder() )
+		batch = max( 1, self.GREEDY_BATCH_ELEMENTS // max(ncities,1) )
+		routes, costs = nearestNeighbourTours( cost_matrix, np.arange( min(batch, ncities) ) )
+		best = int( costs.argmin() )
+		return routes[best] if costs[best] < math.inf else np.random.permutation( ncities )
+
+
+	''' <summary>
+		Lin-Kernighan style solver: the greedy start of fancy improved with 2-opt, Or-opt
+		and 3-opt segment exchange (see LinKernighanSearch), then kicked with double
+		bridges and searched again for as long as time_allowance lasts.  Segment exchange
+		never reverses anything, so it keeps working on asymmetric tours where reversals
+		are too expensive to help.
+		</summary>
+		<returns>results dictionary for GUI that contains the cost of the best tour, the
+		time spent, the number of improving moves made, the best tour, the moves made of
+		each kind and the number of kicks</returns> 
+	'''
+	def linKernighan( self, time_allowance=60.0, neighbours=NEIGHBOURS, seed=None ):
+		results = {}
+		cities = self._scenario.getCities()
+		cost_matrix = self._scenario.costs()
+		start_time = time.time()
+		neighbours = self._scenario.neighbourLists( neighbours )
+		search = LinKernighanSearch( cost_matrix, self._startTour( cost_matrix, neighbours ), neighbours )
+		search.iterate( start_time + time_allowance, np.random.default_rng( seed ) )
+		bssf = TSPSolution.fromTour( self._scenario, search.tour )
+		end_time = time.time()
+		results['cost'] = bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = sum( search.moves.values() )
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		results['moves'] = search.moves
+		results['kicks'] = search.kicks
+		return results
+
+
+	''' <summary>
+		Simulated annealing from the greedy start of fancy.  Every temperature step
+		proposes a batch of random swap, insertion and reversal moves, each changing at
+		most ANNEALING_SPAN consecutive positions, prices them all at once with
+		annealingDeltas and accepts each by the Metropolis rule; of the accepted moves,
+		those that do not touch one another are applied together.  The tour is rotated
+		between steps so every position can move.  The temperature falls geometrically
+		with elapsed time, from start_temperature (by default one at which a typical
+		uphill move is accepted one time in ten) to end_temperature when time_allowance
+		runs out.
+		</summary>
+		<returns>results dictionary for GUI that contains the cost of the best tour, the
+		time spent, the number of moves made, the best tour, the moves made of each kind
+		and the number of temperature steps</returns> 
+	'''
+	ANNEALING_BATCH = 256	# Moves proposed per temperature step
+	ANNEALING_SPAN = 50		# Most positions one move may change, so a batch has room for several
+	def simulatedAnnealing( self, time_allowance=60.0, start_temperature=None, end_temperature=1.0,
+							batch=ANNEALING_BATCH, seed=None ):
+		results = {}
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		cost_matrix = self._scenario.costs()
+		rng = np.random.default_rng( seed )
+		start_time = time.time()
+		tour = np.array( self._startTour( cost_matrix ), dtype=np.int64 )
+		best_tour, best_cost = tour.copy(), math.inf
+		moves = np.zeros( len(ANNEALING_MOVES), dtype=np.int64 )
+		steps = 0
+		while ncities >= 4:
+			fwd, bwd = tourEdgeSums( cost_matrix, tour )
+			if fwd[-1] < best_cost:
+				best_tour, best_cost = tour.copy(), fwd[-1]
+			elapsed = (time.time()-start_time) / time_allowance
+			if elapsed >= 1.0:
+				break
+			kinds = rng.integers( len(ANNEALING_MOVES), size=batch )
+			spans = rng.integers( 1, min( ncities-3, self.ANNEALING_SPAN ) + 1, size=batch )
+			i = rng.integers( 1, ncities-1-spans )
+			j = i + spans
+			deltas = annealingDeltas( cost_matrix, tour, fwd, bwd, kinds, i, j )
+			if start_temperature is None:
+				uphill = deltas[(deltas > 0) & (deltas < NO_EDGE)]
+				start_temperature = float( np.median(uphill) ) / math.log(10) if len(uphill) else end_temperature
+			temperature = start_temperature * (end_temperature/start_temperature) ** elapsed
+			accepted = np.flatnonzero( rng.random( batch ) < np.exp( -np.maximum(deltas, 0) / temperature ) )
+			# Moves are applied together only if none of them reads an edge another changes
+			accepted = accepted[ np.argsort( i[accepted] ) ]
+			reach = np.concatenate( ([-2], np.maximum.accumulate( j[accepted] )[:-1]) )
+			for move in accepted[ i[accepted] > reach+1 ]:
+				applyAnnealingMove( tour, kinds[move], i[move], j[move] )
+				moves[kinds[move]] += 1
+			tour = np.roll( tour, -int( rng.integers(ncities) ) )
+			steps += 1
+		bssf = TSPSolution.fromTour( self._scenario, best_tour )
+		end_time = time.time()
+		results['cost'] = bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = int( moves.sum() )
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		results['moves'] = dict( zip( ANNEALING_MOVES, moves.tolist() ) )
+		results['steps'] = steps
+		return results
+
+
+	''' <summary>
+		Genetic algorithm over a population matrix, one tour per row (see
+		evolvePopulation), seeded with the greedy start of fancy and random tours.  With
+		islands above 1 there are that many populations, evolved side by side by a
+		process pool (processes=None for one per island, up to one per CPU); every
+		MIGRATION_GENERATIONS generations each island's elite replaces the worst tours
+		of the next island along.
+		</summary>
+		<returns>results dictionary for GUI that contains the cost of the best tour, the
+		time spent, the number of tours bred, the best tour and the number of generations
+		each island ran</returns> 
+	'''
+	GENETIC_POPULATION = 200	# Tours per island
+	MIGRATION_GENERATIONS = 50	# Generations between migrations (and between checks on the pool)
+	def genetic( self, time_allowance=60.0, population=GENETIC_POPULATION, elite=4, mutation=0.3,
+				 islands=1, processes=None, seed=None ):
+		results = {}
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		cost_matrix = self._scenario.costMatrix()
+		start_time = time.time()
+		deadline = start_time + time_allowance
+		seeds = np.random.SeedSequence( seed )
+		rng = np.random.default_rng( seeds.spawn(1)[0] )
+		start = self._startTour( cost_matrix )
+		populations = []
+		for island in range( islands ):
+			tours = rng.permuted( np.tile( np.arange(ncities), (population, 1) ), axis=1 )
+			tours[0] = start
+			populations.append( tours )
+		processes = min( islands, processes or os.cpu_count() )
+		generations = 0
+		pool = shared = None
+		try:
+			if processes == 1:
+				_initGeneticWorker( {'cost_matrix': cost_matrix} )
+			else:
+				shared = SharedArrays.forPool( cost_matrix=cost_matrix )
+				pool = multiprocessing.Pool( processes, initializer=_initGeneticWorker, initargs=(shared,) )
+			while True:
+				tasks = [(tours, child, self.MIGRATION_GENERATIONS, deadline, elite, mutation)
+						 for tours, child in zip( populations, seeds.spawn(islands) )]
+				outcomes = pool.map( _evolveIsland, tasks ) if pool is not None else list( map( _evolveIsland, tasks ) )
+				populations = [tours for tours, costs, run in outcomes]
+				best_costs = [costs[0] for tours, costs, run in outcomes]
+				generations += max( run for tours, costs, run in outcomes )
+				if time.time() >= deadline:
+					break
+				if islands > 1:
+					# Ring migration: the worst tours of each island make way for the last one's elite
+					elites = [tours[:elite].copy() for tours in populations]
+					for island in range( islands ):
+						populations[island][population-elite:] = elites[island-1]
+		finally:
+			if pool is not None:
+				pool.terminate()
+			if shared is not None:
+				shared.close()
+		best = int( np.argmin( best_costs ) )
+		bssf = TSPSolution.fromTour( self._scenario, populations[best][0] )
+		end_time = time.time()
+		results['cost'] = bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = generations * (population-elite) * islands
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		results['generations'] = generations
+		return results
+
+
+	''' <summary>
+		Ant colony optimization (an elitist ant system).  The pheromone and heuristic
+		(1/cost) matrices are n*n arrays, with missing edges masked to zero so no ant
+		ever takes one.  Every iteration a batch of ants builds tours together (see
+		antTours), then all pheromone evaporates by the evaporation rate and each
+		complete tour, plus the best tour so far, deposits 1/cost on its edges with a
+		single np.add.at.  Ants never get stuck on a broken greedy path, which suits
+		Hard scenarios.
+		</summary>
+		<returns>results dictionary for GUI that contains the cost of the best tour, the
+		time spent, the number of complete tours built, the best tour and the number of
+		iterations</returns> 
+	'''
+	ANT_COLONY = 32		# Ants per iteration, at most one per city
+	def antColony( self, time_allowance=60.0, ants=ANT_COLONY, alpha=1.0, beta=3.0, evaporation=0.1, seed=None ):
+		results = {}
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		cost_matrix = self._scenario.costMatrix()
+		rng = np.random.default_rng( seed )
+		start_time = time.time()
+		ants = min( ants, ncities )
+		present = hasEdge( cost_matrix )
+		heuristic = np.zeros( cost_matrix.shape )
+		heuristic[present] = 1.0 / np.maximum( cost_matrix[present], 1 )
+		# Start the pheromone at the level a greedy tour would lay down
+		start = self._startTour( cost_matrix )
+		start_cost = populationCosts( cost_matrix, start[np.newaxis] )[0]
+		if start_cost >= NO_EDGE:
+			start_cost = ncities * cost_matrix[present].mean()
+		pheromone = np.full( cost_matrix.shape, 1.0 / (ncities*start_cost) )
+		best_route, best_cost = None, math.inf
+		count = 0
+		iterations = 0
+		while time.time()-start_time < time_allowance:
+			weights = pheromone**alpha * heuristic**beta
+			routes, complete = antTours( cost_matrix, weights, rng.integers( ncities, size=ants ), rng )
+			routes = routes[complete]
+			costs = populationCosts( cost_matrix, routes )
+			count += len(routes)
+			iterations += 1
+			if len(routes) and costs.min() < best_cost:
+				best_route, best_cost = routes[costs.argmin()], costs.min()
+			pheromone *= 1.0 - evaporation
+			if best_route is not None:
+				deposits = np.concatenate( (routes, best_route[np.newaxis]) )
+				amounts = np.repeat( 1.0 / np.append( costs, best_cost ), ncities )
+				np.add.at( pheromone, (deposits.ravel(), np.roll( deposits, -1, axis=1 ).ravel()), amounts )
+		bssf = TSPSolution.fromTour( self._scenario, best_route ) if best_route is not None else None
+		end_time = time.time()
+		results['cost'] = bssf.cost if bssf else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = count
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		results['iterations'] = iterations
+		return results
+
+
+	''' <summary>
+		Exact solver by Held-Karp dynamic programming over (subset, last city), see
+		heldKarpTour.  It takes O(2^n * n^2) time and heldKarpBytes(n) memory whatever
+		the costs are, so it is only for small scenarios (about 23 cities with the
+		default memory_bytes); bigger ones are refused rather than run out of memory.
+		</summary>
+		<returns>results dictionary for GUI that contains the cost of the optimal tour,
+		the time spent, the number of solutions (1, or 0 if there was none), the optimal
+		tour and the number of (subset, last city) states.  If the scenario is too big
+		or time ran out the solution is None and error says why.</returns> 
+	'''
+	HELD_KARP_MEMORY = 1<<30	# Default cap on the memory heldKarpTour may take
+	def heldKarp( self, time_allowance=60.0, memory_bytes=HELD_KARP_MEMORY ):
+		results = {}
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		cost_matrix = self._scenario.costMatrix()
+		start_time = time.time()
+		bssf = None
+		needed = heldKarpBytes( ncities )
+		if needed > memory_bytes:
+			results['error'] = 'Held-Karp needs {} bytes for {} cities, over the limit of {}'.format( needed, ncities, memory_bytes )
+		else:
+			tour = heldKarpTour( cost_matrix, start_time + time_allowance )
+			if tour is None:
+				results['error'] = 'Held-Karp ran out of time'
+			elif tour[0] is not None:
+				bssf = TSPSolution.fromTour( self._scenario, tour[0] )
+		end_time = time.time()
+		results['cost'] = bssf.cost if bssf else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = 1 if bssf else 0
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = (1<<max( ncities-1, 0 )) * max( ncities-1, 0 )
+		results['pruned'] = None
+		return results
+
+	''' <summary>
+		Runs branchAndBound (with the given options) and checks its tour against the
+		optimum from heldKarp: a complete search must have found an optimal tour, and
+		an unfinished one, or a beam search that dropped states, can be no better than
+		optimal.
+		</summary>
+		<returns>the branchAndBound results, plus the optimal cost and whether the two
+		agree (None if heldKarp could not solve the scenario)</returns> 
+	'''
+	def checkBranchAndBound( self, time_allowance=60.0, memory_bytes=HELD_KARP_MEMORY, **options ):
+		exact = self.heldKarp( time_allowance, memory_bytes )
+		results = self.branchAndBound( time_allowance, **options )
+		results['optimal'] = exact['cost']
+		if 'error' in exact:
+			results['agrees'] = None
+		elif results['complete']:
+			results['agrees'] = results['cost'] == exact['cost']
+		else:
+			results['agrees'] = results['cost'] >= exact['cost']
+		return results
 		
+''' <summary>
+	Frontiers for branchAndBound.  PriorityQueue is plain best-first search on the lower
+	bound; the subclasses only change the order nodes come back out (or, for the beam,
+	how many are kept).  All of them count their pushes, pops, peak size and the nodes
+	they dropped, which branchAndBound reports in its results.
+	</summary>
+'''
 class PriorityQueue:
-	def __init__( self):
-		list = []
-		heapq.heapify(list)
-	
-	def pop(self):
-		return heapq.heappop(list)
-	
-	def push(self, element):
-		heapq.heappush(list, element)
-	
-	#def compare(self, element):
-	#	pass
+	name = 'best'
+
+	def __init__( self ):
+		self._heap = []
+		self._tiebreak = itertools.count()	# Keeps heapq from ever comparing two nodes
+		self.pushes = 0
+		self.pops = 0
+		self.max_size = 0
+		self.dropped = 0
+		self.on_drop = None		# Called with the nodes a bounded frontier throws away
+
+	def key( self, node ):
+		return node.bound
+
+	def __len__( self ):
+		return len(self._heap)
+
+	def push( self, node ):
+		heapq.heappush( self._heap, (self.key(node), next(self._tiebreak), node) )
+		self.pushes += 1
+		if len(self) > self.max_size:
+			self.max_size = len(self)
+
+	def extend( self, nodes ):
+		for node in nodes:
+			self.push( node )
+
+	def pop( self ):
+		self.pops += 1
+		return heapq.heappop( self._heap )[-1]
+
+	def solutionFound( self ):
+		pass
+
+	def nodes( self ):
+		''' Everything still queued, in no particular order. '''
+		return [entry[-1] for entry in self._heap]
+
+	def evictWorst( self, count ):
+		''' Removes and returns the count queued nodes with the highest keys. '''
+		self._heap.sort()	# A sorted list is still a heap
+		worst = self._heap[len(self._heap)-count:]
+		del self._heap[len(self._heap)-count:]
+		return [entry[-1] for entry in worst]
+
+	def close( self ):
+		pass
+
+	def counters( self ):
+		return { 'pushes':self.pushes, 'pops':self.pops, 'max':self.max_size, 'dropped':self.dropped }
+
+class DepthBiasedQueue( PriorityQueue ):
+	# Best-first on bound / depth, so deeper nodes with similar bounds go first
+	name = 'depth'
+
+	def key( self, node ):
+		return node.bound / node.depth
+
+class DiveQueue( PriorityQueue ):
+	# Depth-first, always diving into the child with the lowest bound first
+	name = 'dive'
+
+	def __init__( self ):
+		super().__init__()
+		self._stack = []
+
+	def __len__( self ):
+		return len(self._stack) + len(self._heap)
+
+	def extend( self, nodes ):
+		nodes = sorted( nodes, key=lambda node: node.bound, reverse=True )
+		self._stack.extend( nodes )
+		self.pushes += len(nodes)
+		if len(self) > self.max_size:
+			self.max_size = len(self)
+
+	def push( self, node ):
+		self.extend( [node] )
+
+	def pop( self ):
+		self.pops += 1
+		return self._stack.pop()
+
+	def nodes( self ):
+		return (self._stack or []) + PriorityQueue.nodes( self )
+
+	def evictWorst( self, count ):
+		if not self._stack:
+			return PriorityQueue.evictWorst( self, count )
+		# Take the highest bounds off the stack, leaving the dive order of the rest alone
+		bounds = np.array( [node.bound for node in self._stack] )
+		worst = np.zeros( len(bounds), dtype=bool )
+		worst[np.argsort( bounds, kind='stable' )[len(bounds)-count:]] = True
+		evicted = [node for node, evict in zip(self._stack, worst) if evict]
+		self._stack[:] = [node for node, evict in zip(self._stack, worst) if not evict]
+		return evicted
+
+class HybridQueue( DiveQueue ):
+	# Dives until the first solution better than the initial BSSF, then goes best-first
+	name = 'hybrid'
+
+	def __len__( self ):
+		return len(self._heap) + (len(self._stack) if self._stack is not None else 0)
+
+	def push( self, node ):
+		if self._stack is None:
+			PriorityQueue.push( self, node )
+		else:
+			DiveQueue.push( self, node )
+
+	def extend( self, nodes ):
+		if self._stack is None:
+			PriorityQueue.extend( self, nodes )
+		else:
+			DiveQueue.extend( self, nodes )
+
+	def pop( self ):
+		if self._stack is None:
+			return PriorityQueue.pop( self )
+		return DiveQueue.pop( self )
+
+	def solutionFound( self ):
+		if self._stack is not None:
+			stack, self._stack = self._stack, None
+			for node in stack:
+				heapq.heappush( self._heap, (self.key(node), next(self._tiebreak), node) )
+
+class BeamQueue( PriorityQueue ):
+	# Best-first, but only the width best nodes are kept; the search is no longer exact
+	name = 'beam'
+
+	def __init__( self, width=1000 ):
+		super().__init__()
+		self.width = width
+
+	def push( self, node ):
+		super().push( node )
+		if len(self._heap) > 2*self.width:
+			dropped = self.evictWorst( len(self._heap) - self.width )	# Leaves a sorted list, which is a heap
+			self.dropped += len(dropped)
+			if self.on_drop is not None:
+				self.on_drop( dropped )
+
+FRONTIER_STRATEGIES = { queue.name:queue for queue in
+						(PriorityQueue, DepthBiasedQueue, DiveQueue, HybridQueue, BeamQueue) }
+
+''' <summary>
+	Wraps any of the frontiers above to keep it within memory_bytes.  When the queued
+	nodes outgrow the budget, the worse half of them is sorted by bound and written to
+	a run file of fixed-size binary records (bound, path cost, depth and the path
+	padded with -1); their states are dropped, to be rebuilt when they are expanded.
+	Once the in-memory frontier is empty it is refilled from the runs in bound order,
+	half a budget's worth of nodes at a time.  A beam's width covers the spilled nodes
+	too: whenever the frontier as a whole outgrows twice the width, only the width best
+	nodes, in memory or on disk, are kept.
+	</summary>
+'''
+class SpillingFrontier:
+	def __init__( self, frontier, memory_bytes, ncities, directory=None ):
+		self.inner = frontier
+		self.inner.on_drop = self._dropped
+		self.name = frontier.name
+		self.memory_bytes = memory_bytes
+		self.directory = directory
+		self._dtype = pathDtype( ncities )
+		self._records = np.dtype( [('bound', np.float64), ('cost', np.int64), ('depth', np.int32),
+								   ('path', self._dtype, (ncities,))] )
+		self._bytes = 0
+		self._runs = []		# [file name, records in the file, records already read back]
+		self.spilled = 0
+		self.loaded = 0
+		self.run_files = 0
+
+	@property
+	def max_size( self ):
+		return self.inner.max_size
+
+	def __len__( self ):
+		return len(self.inner) + sum( count-read for _, count, read in self._runs )
+
+	def push( self, node ):
+		self.extend( [node] )
+
+	def extend( self, nodes ):
+		self._bytes += sum( node.nbytes() for node in nodes )
+		self.inner.extend( nodes )
+		width = getattr( self.inner, 'width', None )
+		if width is not None and self._runs and len(self) > 2*width:
+			self._trim( width )
+		if self._bytes > self.memory_bytes and len(self.inner) > 1:
+			self._spill()
+
+	def _dropped( self, nodes ):
+		self._bytes -= sum( node.nbytes() for node in nodes )
+
+	def _trim( self, width ):
+		''' Keeps only the width best nodes (by bound) of the in-memory frontier and the runs together. '''
+		remaining = [np.memmap( file_name, dtype=self._records, mode='r' )['bound'][read:total]
+					 for file_name, total, read in self._runs]
+		bounds = np.concatenate( [[node.bound for node in self.inner.nodes()]] + remaining )
+		owners = np.concatenate( [np.full( len(self.inner), -1 )] +
+								 [np.full( len(run_bounds), k ) for k, run_bounds in enumerate( remaining )] )
+		kept = owners[ np.argsort( bounds, kind='stable' )[:width] ]
+		self._dropped( self.inner.evictWorst( len(self.inner) - int( np.count_nonzero(kept == -1) ) ) )
+		for k, run in enumerate( self._runs ):
+			run[1] = run[2] + int( np.count_nonzero(kept == k) )	# Runs are sorted, so the kept nodes lead each one
+		for run in [run for run in self._runs if run[2] >= run[1]]:
+			os.remove( run[0] )
+			self._runs.remove( run )
+		self.inner.dropped += len(bounds) - width
+
+	def pop( self ):
+		if len(self.inner) == 0:
+			self._refill()
+		node = self.inner.pop()
+		self._bytes -= node.nbytes()
+		return node
+
+	def solutionFound( self ):
+		self.inner.solutionFound()
+
+	def _spill( self ):
+		nodes = self.inner.evictWorst( len(self.inner) // 2 )
+		self._bytes -= sum( node.nbytes() for node in nodes )
+		records = np.zeros( len(nodes), dtype=self._records )
+		records['path'] = -1
+		for k, node in enumerate( nodes ):
+			records[k]['bound'] = node.bound
+			records[k]['cost'] = node.cost
+			records[k]['depth'] = node.depth
+			records[k]['path'][:node.depth] = node.path
+		records.sort( order='bound', kind='stable' )
+		handle, file_name = tempfile.mkstemp( suffix='.run', prefix='tsp-frontier-', dir=self.directory )
+		with os.fdopen( handle, 'wb' ) as run_file:
+			records.tofile( run_file )
+		self._runs.append( [file_name, len(records), 0] )
+		self.spilled += len(records)
+		self.run_files += 1
+
+	def _read( self, run, count ):
+		file_name, total, read = run
+		records = np.memmap( file_name, dtype=self._records, mode='r' )
+		return np.array( records[read:min(read+count, total)] )
+
+	def _toNode( self, record ):
+		depth = int(record['depth'])
+		return SearchNode( float(record['bound']), record['path'][:depth].astype(self._dtype), int(record['cost']) )
+
+	def _refill( self ):
+		# Each run is sorted, so the next nodes in bound order are a prefix of every run
+		chunk = max( 1, self.memory_bytes // (2*(SearchNode.OVERHEAD_BYTES + self._records.itemsize)) )
+		heads = [self._read( run, chunk ) for run in self._runs]
+		owners = np.concatenate( [np.full(len(head), k) for k, head in enumerate(heads)] )
+		merged = np.concatenate( heads )
+		order = np.argsort( merged['bound'], kind='stable' )[:chunk]
+		for k, run in enumerate( self._runs ):
+			run[2] += int( np.count_nonzero(owners[order] == k) )
+		nodes = [self._toNode( record ) for record in merged[order]]
+		self.loaded += len(nodes)
+		for run in [run for run in self._runs if run[2] >= run[1]]:
+			os.remove( run[0] )
+			self._runs.remove( run )
+		self._bytes += sum( node.nbytes() for node in nodes )
+		self.inner.extend( nodes )
+
+	def nodes( self ):
+		nodes = self.inner.nodes()
+		for run in self._runs:
+			nodes.extend( self._toNode(record) for record in self._read( run, run[1] ) )
+		return nodes
+
+	def close( self ):
+		for file_name, _, _ in self._runs:
+			os.remove( file_name )
+		self._runs = []
+
+	def counters( self ):
+		counters = self.inner.counters()
+		counters.update( { 'spilled':self.spilled, 'loaded':self.loaded, 'runs':self.run_files } )
+		return counters
+
+
+
+''' <summary>
+	The branch-and-bound loop itself: a frontier, a lower bound and a dominance table
+	over the scenario's cost matrix, searching from any set of subtree roots.  It is
+	kept apart from TSPSolver so the same search can run in pool workers.  best_cost
+	and best_path are the incumbent; a search given a shared incumbent (a
+	multiprocessing.Value) also prunes against, and publishes to, that value.
+	</summary>
+'''
+class BranchAndBoundSearch:
+	TASKS_PER_PROCESS = 8	# Subtrees handed out per worker, so the pool stays balanced
+
+	def __init__( self, edge_costs, strategy='best', beam_width=1000, bound='reduction',
+				  keep_states=False, dominance_bytes=64<<20, memory_bytes=None, spill_dir=None, incumbent=None ):
+		self.edge_costs = edge_costs
+		self.options = { 'strategy':strategy, 'beam_width':beam_width, 'bound':bound,
+						 'keep_states':keep_states, 'dominance_bytes':dominance_bytes,
+						 'memory_bytes':memory_bytes, 'spill_dir':spill_dir }
+		self.start_city = 0	# We will always start at the first city in the array
+		self.bounding = LOWER_BOUNDS[bound]( edge_costs, self.start_city )
+		self.dominance = DominanceTable( dominance_bytes ) if dominance_bytes else None
+		self.incumbent = incumbent
+		self.best_cost = math.inf
+		self.best_path = None
+		self.reset()
+
+	def reset( self ):
+		''' Fresh frontier and counters; the bound and dominance table are kept. '''
+		if self.options['strategy'] == BeamQueue.name:
+			self.frontier = BeamQueue( self.options['beam_width'] )
+		else:
+			self.frontier = FRONTIER_STRATEGIES[self.options['strategy']]()
+		if self.options['memory_bytes']:
+			self.frontier = SpillingFrontier( self.frontier, self.options['memory_bytes'],
+											  len(self.edge_costs), self.options['spill_dir'] )
+		if self.dominance:
+			self.dominance.dominated = self.dominance.evictions = 0
+		self.solutions = 0
+		self.total = 0
+		self.pruned = 0
+
+	def root( self ):
+		path = np.array( [self.start_city], dtype=pathDtype(len(self.edge_costs)) )
+		return SearchNode( self.bounding.root_bound, path, state=self.bounding.root_state )
+
+	def bssfCost( self ):
+		if self.incumbent is not None and self.incumbent.value < self.best_cost:
+			return self.incumbent.value
+		return self.best_cost
+
+	def isPruned( self, node ):
+		# The BSSF or the dominance table may have improved since this node was queued
+		return node.bound >= self.bssfCost() or (self.dominance and self.dominance.isStale(node))
+
+	def expand( self, node ):
+		''' Creates the children of node, records any complete tour that beats the BSSF
+		and returns the children that are still worth searching. '''
+		edge_costs = self.edge_costs
+		ncities = len(edge_costs)
+		state = node.state if node.state is not None else self.bounding.rebuild( node.path )
+		current_city = node.path[-1]	# Our current city is always the last one on the path
+		completes_tour = node.depth+1 == ncities
+		unvisited = np.ones( ncities, dtype=bool )
+		unvisited[node.path] = False
+		children = []
+		for city in np.flatnonzero( hasEdge(edge_costs[current_city]) & unvisited ):
+			self.total += 1
+			child_cost = node.cost + int(edge_costs[current_city, city])
+			if self.dominance and not completes_tour and \
+			   self.dominance.isDominated( node.visited | (1<<int(city)), city, child_cost ):
+				self.pruned += 1
+				continue
+			child_bound, child_state = self.bounding.child( node, state, city )
+			if completes_tour:		# The bound of a complete tour is its cost
+				if child_bound < self.bssfCost():
+					self.best_cost = child_bound
+					self.best_path = np.append( node.path, city )
+					self.solutions += 1
+					self.frontier.solutionFound()
+					if self.incumbent is not None:
+						with self.incumbent.get_lock():
+							if child_bound < self.incumbent.value:
+								self.incumbent.value = child_bound
+				else:
+					self.pruned += 1
+			elif child_bound < self.bssfCost():
+				children.append( node.child( city, child_bound, child_cost,
+											 child_state if self.options['keep_states'] else None ) )
+			else:
+				self.pruned += 1	# Updates our pruned nodes
+		return children
+
+	def run( self, nodes, deadline=None ):
+		''' Searches from nodes until the frontier is empty or the deadline passes, and
+		returns the nodes left unexplored. '''
+		self.frontier.extend( nodes )
+		while len(self.frontier) != 0:
+			if deadline is not None and time.time() >= deadline:
+				break
+			node = self.frontier.pop()
+			if self.isPruned( node ):
+				self.pruned += 1
+				continue
+			self.frontier.extend( self.expand(node) )
+		unfinished = self.frontier.nodes()
+		self.frontier.close()
+		return unfinished
+
+	def counters( self ):
+		return { 'solutions':self.solutions, 'total':self.total, 'pruned':self.pruned,
+				 'max':self.frontier.max_size, 'frontier':self.frontier.counters(),
+				 'dominance':self.dominance.counters() if self.dominance else None, 'processes':1 }
+
+	def runParallel( self, processes=None, nodes=None, deadline=None ):
+		''' Expands the tree best-first in this process until there are enough subtrees to
+		keep every worker busy, then searches those subtrees in a process pool that shares
+		the incumbent's cost.  Returns the unexplored nodes and the counters merged over
+		this process and all the subtrees. '''
+		processes = processes or os.cpu_count()
+		self.frontier.extend( nodes or [self.root()] )
+		while 0 < len(self.frontier) < self.TASKS_PER_PROCESS*processes:
+			if deadline is not None and time.time() >= deadline:
+				break
+			node = self.frontier.pop()
+			if self.isPruned( node ):
+				self.pruned += 1
+				continue
+			self.frontier.extend( self.expand(node) )
+		subtrees = sorted( ((node.bound, node.path, node.cost) for node in self.frontier.nodes()),
+						   key=lambda subtree: subtree[0] )
+		self.frontier.close()
+		options = dict( self.options )
+		if options['memory_bytes']:		# The budget is shared by all the workers
+			options['memory_bytes'] = max( 1, options['memory_bytes'] // processes )
+
+		merged = self.counters()
+		merged['processes'] = processes
+		unfinished = []
+		incumbent = multiprocessing.Value( 'd', self.best_cost )
+		with SharedArrays.forPool( edge_costs=self.edge_costs ) as shared, \
+			 multiprocessing.Pool( processes, initializer=_initSearchWorker,
+								   initargs=(shared, options, incumbent, deadline) ) as pool:
+			for best_cost, best_path, counters, left in pool.imap_unordered( _searchSubtree, subtrees ):
+				if best_path is not None and best_cost < self.best_cost:
+					self.best_cost = best_cost
+					self.best_path = best_path
+				_mergeSearchCounters( merged, counters )
+				unfinished.extend( SearchNode(bound, path, cost) for bound, path, cost in left )
+		return unfinished, merged
+
+	''' <summary>
+		Checkpoint files are compressed .npz archives holding the unexplored nodes (bounds,
+		path costs and paths padded with -1 into one small int matrix), the BSSF, the
+		counters and a fingerprint of the cost matrix, so a checkpoint is never resumed
+		against a different scenario.  The file is written to a temporary name first and
+		then moved into place, so an interrupted save never clobbers the last one.
+		</summary>
+	'''
+	def saveCheckpoint( self, path, nodes, counters ):
+		ncities = len(self.edge_costs)
+		paths = np.full( (len(nodes), ncities), -1, dtype=pathDtype(ncities) )
+		for k, node in enumerate( nodes ):
+			paths[k,:node.depth] = node.path
+		best_path = self.best_path if self.best_path is not None else np.zeros( 0, dtype=paths.dtype )
+		with open( path+'.tmp', 'wb' ) as checkpoint_file:
+			np.savez_compressed( checkpoint_file,
+								 ncities=ncities, fingerprint=costFingerprint(self.edge_costs),
+								 bounds=np.array( [node.bound for node in nodes], dtype=float ),
+								 costs=np.array( [node.cost for node in nodes], dtype=np.int64 ),
+								 depths=np.array( [node.depth for node in nodes], dtype=np.int32 ),
+								 paths=paths, best_cost=float(self.best_cost), best_path=best_path,
+								 counters=json.dumps(counters) )
+		os.replace( path+'.tmp', path )
+
+	@staticmethod
+	def loadCheckpoint( path, edge_costs ):
+		''' Returns the saved nodes, BSSF cost and path (None if there was none) and counters. '''
+		with np.load( path ) as checkpoint:
+			if int(checkpoint['ncities']) != len(edge_costs) or \
+			   int(checkpoint['fingerprint']) != costFingerprint(edge_costs):
+				raise ValueError( 'Checkpoint {} was saved for a different scenario'.format(path) )
+			paths = checkpoint['paths']
+			nodes = [ SearchNode( float(bound), paths[k,:depth].copy(), int(cost) ) for k, (bound, cost, depth) in
+					  enumerate( zip(checkpoint['bounds'], checkpoint['costs'], checkpoint['depths']) ) ]
+			best_path = checkpoint['best_path'] if len(checkpoint['best_path']) else None
+			best_cost = float(checkpoint['best_cost'])
+			counters = json.loads( str(checkpoint['counters']) )
+		return nodes, (int(best_cost) if best_cost != math.inf else best_cost), best_path, counters
+
+def costFingerprint( edge_costs ):
+	return zlib.crc32( np.ascontiguousarray(edge_costs).tobytes() )
+
+def _mergeSearchCounters( merged, counters ):
+	for key in ('solutions', 'total', 'pruned'):
+		merged[key] += counters[key]
+	merged['max'] = max( merged['max'], counters['max'] )
+	for key, value in counters['frontier'].items():
+		merged['frontier'][key] = max( merged['frontier'].get(key, 0), value ) if key == 'max' else merged['frontier'].get(key, 0) + value
+	if merged['dominance'] is not None and counters['dominance'] is not None:
+		for key, value in counters['dominance'].items():
+			merged['dominance'][key] = max( merged['dominance'].get(key, 0), value ) if key == 'entries' else merged['dominance'].get(key, 0) + value
+
+_search_shared = _search_worker = None
 
+def _initSearchWorker( shared, options, incumbent, deadline ):
+	# Each worker keeps one search, so its bound and dominance table serve all its subtrees
+	global _search_worker, _search_shared
+	_search_shared = shared
+	_search_worker = ( BranchAndBoundSearch( shared['edge_costs'], incumbent=incumbent, **options ), deadline )
 
+def _searchSubtree( subtree ):
+	search, deadline = _search_worker
+	search.reset()
+	search.best_cost, search.best_path = math.inf, None
+	bound, path, cost = subtree
+	left = search.run( [SearchNode( bound, path, cost )], deadline )
+	return search.best_cost, search.best_path, search.counters(), [(node.bound, node.path, node.cost) for node in left]